@@ -0,0 +1,232 @@
+"""Local SQLite mirror of the data behind the heavy reports.
+
+Set ANALYTICS_DB to a file path to enable. The mirror holds competitions,
+shooters, per-string MCSI and per-competition shot value counts, and
+records the import run it was synced to. A web process that sees a newer
+data version starts a background sync (one per host, via a lock file) and
+keeps answering from Postgres until the mirror has caught up, so reports
+never read stale data from it.
+
+Usage:
+    python analytics.py sync [--full]
+"""
+import fcntl
+import logging
+import os
+import sqlite3
+import sys
+import threading
+
+from db import get_connection
+from schema import get_changes_since
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DB = os.getenv('ANALYTICS_DB')
+SYNC_CHUNK = 20000
+
+MIRROR_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);",
+    """CREATE TABLE IF NOT EXISTS competitions (
+           competition_id INTEGER PRIMARY KEY, year INTEGER, state_code TEXT);""",
+    """CREATE TABLE IF NOT EXISTS shooters (
+           sid INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, club_name TEXT);""",
+    """CREATE TABLE IF NOT EXISTS strings (
+           string_id INTEGER PRIMARY KEY, competition_id INTEGER, shooter_sid INTEGER,
+           discipline TEXT, mcsi REAL);""",
+    "CREATE INDEX IF NOT EXISTS strings_competition_idx ON strings (competition_id);",
+    """CREATE TABLE IF NOT EXISTS shot_counts (
+           competition_id INTEGER, discipline TEXT, shot_value TEXT, count INTEGER,
+           PRIMARY KEY (competition_id, discipline, shot_value));""",
+    "CREATE INDEX IF NOT EXISTS shot_counts_discipline_idx ON shot_counts (discipline);",
+]
+
+
+def enabled():
+    return bool(ANALYTICS_DB)
+
+
+def _open(path, readonly=False):
+    if readonly:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode=WAL;')
+        for statement in MIRROR_SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+    return conn
+
+
+def synced_run(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'run_id';").fetchone()
+    return row[0] if row else None
+
+
+def _copy(pg_conn, mirror, name, query, params, insert):
+    """Stream a Postgres query into the mirror in chunks."""
+    cur = pg_conn.cursor(name=f'analytics_{name}')
+    cur.itersize = SYNC_CHUNK
+    cur.execute(query, params)
+    count = 0
+    while True:
+        rows = cur.fetchmany(SYNC_CHUNK)
+        if not rows:
+            break
+        mirror.executemany(insert, rows)
+        count += len(rows)
+    cur.close()
+    return count
+
+
+def sync(pg_conn, path=ANALYTICS_DB, full=False):
+    """Bring the mirror up to the latest import run. Returns the run id synced to."""
+    mirror = _open(path)
+    last = None if full else synced_run(mirror)
+
+    cur = pg_conn.cursor()
+    if last is None:
+        run_id, _, _ = get_changes_since(cur, 0)
+        cur.execute("SELECT competition_id FROM competitions;")
+        competition_ids = [row[0] for row in cur.fetchall()]
+        shooter_filter = 'TRUE'
+        shooter_params = {}
+    else:
+        run_id, changed, changed_sids = get_changes_since(cur, last)
+        if run_id == last:
+            mirror.close()
+            return run_id
+        competition_ids = sorted(changed)
+        shooter_filter = '''sh.sid = ANY(%(sids)s) OR sh.sid IN (
+            SELECT shooter_sid FROM strings WHERE competition_id = ANY(%(ids)s))'''
+        shooter_params = {'sids': sorted(changed_sids), 'ids': competition_ids}
+
+    # One SQLite transaction, so readers see either the old or the new mirror
+    with mirror:
+        if last is None:
+            for table in ('competitions', 'shooters', 'strings', 'shot_counts'):
+                mirror.execute(f"DELETE FROM {table};")
+        else:
+            marks = ','.join('?' * len(competition_ids))
+            for table in ('competitions', 'strings', 'shot_counts'):
+                mirror.execute(f"DELETE FROM {table} WHERE competition_id IN ({marks});",
+                               competition_ids)
+
+        _copy(pg_conn, mirror, 'competitions', '''
+            SELECT c.competition_id, c.year, s.code
+            FROM competitions c JOIN states s ON c.state_id = s.state_id
+            WHERE c.competition_id = ANY(%s);
+        ''', (competition_ids,), "INSERT INTO competitions VALUES (?, ?, ?);")
+        _copy(pg_conn, mirror, 'shooters', f'''
+            SELECT sh.sid, sh.first_name, sh.last_name, cl.club_name
+            FROM shooters sh LEFT JOIN clubs cl ON sh.club_id = cl.club_id
+            WHERE {shooter_filter};
+        ''', shooter_params, "INSERT OR REPLACE INTO shooters VALUES (?, ?, ?, ?);")
+        strings = _copy(pg_conn, mirror, 'strings', '''
+            SELECT string_id, competition_id, shooter_sid, discipline, mcsi::float8
+            FROM strings WHERE competition_id = ANY(%s);
+        ''', (competition_ids,), "INSERT INTO strings VALUES (?, ?, ?, ?, ?);")
+        _copy(pg_conn, mirror, 'shot_counts', '''
+            SELECT st.competition_id, st.discipline, sh.shot_value, COUNT(*)
+            FROM shots sh JOIN strings st ON sh.string_id = st.string_id
+            WHERE st.competition_id = ANY(%s)
+            GROUP BY st.competition_id, st.discipline, sh.shot_value;
+        ''', (competition_ids,), "INSERT INTO shot_counts VALUES (?, ?, ?, ?);")
+        mirror.execute("INSERT OR REPLACE INTO meta VALUES ('run_id', ?);", (run_id,))
+
+    pg_conn.commit()
+    mirror.close()
+    logger.info("Synced analytics mirror to run %s (%d competitions, %d strings)",
+                run_id, len(competition_ids), strings)
+    return run_id
+
+
+_sync_lock = threading.Lock()
+_syncing = {'pid': None}
+
+
+def _sync_in_background(path):
+    def run():
+        lock_file = open(path + '.lock', 'w')
+        try:
+            # Only one process per host syncs; the others keep using Postgres
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            _syncing['pid'] = None
+            return
+        conn = get_connection()
+        try:
+            sync(conn, path)
+        except Exception:
+            logger.exception("Analytics mirror sync failed")
+        finally:
+            conn.close()
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            _syncing['pid'] = None
+
+    with _sync_lock:
+        if _syncing['pid'] == os.getpid():
+            return
+        _syncing['pid'] = os.getpid()
+    threading.Thread(target=run, name='analytics-sync', daemon=True).start()
+
+
+def open_mirror(version, path=ANALYTICS_DB):
+    """A read-only mirror connection if it is synced to version, else None.
+
+    A stale or missing mirror triggers a background sync.
+    """
+    if not path:
+        return None
+    if os.path.exists(path):
+        conn = _open(path, readonly=True)
+        try:
+            current = synced_run(conn)
+        except sqlite3.Error:
+            current = None
+        if current is not None and current >= version:
+            return conn
+        conn.close()
+    _sync_in_background(path)
+    return None
+
+
+def leaderboard_rows(conn, year=None):
+    """(sid, first_name, last_name, club, discipline, mcsi) for every string with an MCSI."""
+    query = '''
+        SELECT sh.sid, sh.first_name, sh.last_name, sh.club_name, st.discipline, st.mcsi
+        FROM strings st
+        JOIN shooters sh ON st.shooter_sid = sh.sid
+        JOIN competitions c ON st.competition_id = c.competition_id
+        WHERE st.mcsi IS NOT NULL
+    '''
+    params = []
+    if year:
+        query += ' AND c.year = ?'
+        params.append(year)
+    return conn.execute(query, params).fetchall()
+
+
+def shot_distribution(conn, disciplines):
+    marks = ','.join('?' * len(disciplines))
+    rows = conn.execute(f'''
+        SELECT shot_value, SUM(count)
+        FROM shot_counts
+        WHERE discipline IN ({marks})
+        GROUP BY shot_value
+        ORDER BY shot_value;
+    ''', disciplines).fetchall()
+    return {value: count for value, count in rows}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'sync' or not ANALYTICS_DB:
+        print(__doc__)
+        print("ANALYTICS_DB must be set.")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    conn = get_connection()
+    sync(conn, full='--full' in sys.argv[2:])
+    conn.close()
@@ -1,135 +1,43 @@
-from flask import Flask, render_template, request, jsonify
-from db import get_connection
-
-app = Flask(__name__)
-
-# Discipline normalization mapping
-DISCIPLINE_MAP = {
-    # Target Rifle
-    'Target Rifle - A': 'TR-A',
-    'Target Rifle - B': 'TR-B',
-    'Target Rifle - C': 'TR-C',
-    'Target Rifle - C - Tyro': 'TR-C',
-
-    # F Standard
-    'F Standard - A': 'F-Std-A',
-    'F Standard-A': 'F-Std-A',
-    'F Standard - B': 'F-Std-B',
-    'F Standard-B': 'F-Std-B',
-    'Division F Standard Open': 'F-Std-Open',
-
-    # F Open
-    'F Open': 'F-Open',
-    'F Open - FO': 'F-Open',
-    'Division Open': 'F-Open',
-
-    # F/TR
-    'F/TR - FTR': 'FTR',
-
-    # Sporter - Hunter became Sporter Open
-    'Sporter - Hunter A': 'Sporter-Open',
-    'Sporter - Production Class OPEN - Open': 'Sporter-Open',
-    'Sporter - F Class Open - A': 'Sporter-Open',
-
-    # Sporter PC
-    'Sporter - Production Class - Sporter PC': 'Sporter-PC',
-    'Sporter - F Class - A': 'Sporter-PC',
-}
-
-DISCIPLINE_GROUPS = {
-    'Target Rifle': ['TR-A', 'TR-B', 'TR-C'],
-    'F Standard': ['F-Std-A', 'F-Std-B', 'F-Std-Open'],
-    'F Open': ['F-Open'],
-    'F/TR': ['FTR'],
-    'Sporter': ['Sporter-Open', 'Sporter-PC'],
-}
-
-# MCSI (Mixed Category Score Index) parameters for 2025
-# Formula: MCSI = ((Score + Centres) × Multiplier) + Offset
-MCSI_PARAMS = {
-    'F-Open': {'multiplier': 1.42, 'offset': 1.8},
-    'F-Std-A': {'multiplier': 1.42, 'offset': 1.8},
-    'F-Std-B': {'multiplier': 1.42, 'offset': 1.8},
-    'F-Std-Open': {'multiplier': 1.42, 'offset': 1.8},
-    'FTR': {'multiplier': 1.42, 'offset': 1.8},
-    'TR-A': {'multiplier': 1.62, 'offset': 8.4},
-    'TR-B': {'multiplier': 1.62, 'offset': 8.4},
-    'TR-C': {'multiplier': 1.62, 'offset': 8.4},
-    'Sporter-Open': {'multiplier': 1.5, 'offset': 12},
-    'Sporter-PC': {'multiplier': 1.5, 'offset': 12},
-}
-
-
-def convert_60_to_50(score, shots_raw):
-    """Convert a score shot on 60-point target to 50-point equivalent.
-    X → V (centre), 6 → 5 (max score)
-    """
-    if score is None:
-        return None, None
-
-    if shots_raw:
-        # Count 6s to subtract from score
-        sixes = shots_raw.count('6')
-        # Convert shots: X→V, 6→5
-        converted_shots = shots_raw.replace('X', 'V').replace('6', '5')
-    else:
-        sixes = 0
-        converted_shots = shots_raw
-
-    # Subtract 1 point for each 6 (since 6→5)
-    points = int(score)
-    centres = round((score % 1) * 10)
-    converted_points = points - sixes
-    converted_score = converted_points + (centres / 10)
-
-    return round(converted_score, 2), converted_shots
-
-
-def needs_60_to_50_conversion(state_code, year, discipline):
-    """Check if this competition/discipline needs 60→50 conversion."""
-    # VRA 2025 Sporter disciplines were shot on 60s
-    if state_code == 'VRA' and year == 2025:
-        norm = normalize_discipline(discipline)
-        if 'Sporter' in norm:
-            return True
-    return False
-
-
-def calculate_mcsi(score, discipline, state_code=None, year=None, shots_raw=None):
-    """Calculate MCSI from score and discipline."""
-    if score is None:
-        return None
+import json
+import logging
+import os
+import time
+from functools import partial
+from flask import Blueprint, Flask, Response, render_template, request, jsonify
+from db import get_pool, get_pooled_connection
+from cache import FragmentCache, ReportStore, data_version
+import analytics
+import profiling
+from head_to_head import compare, load_results
+from shot_sequence import sequence_report
+from scoring import DISCIPLINE_MAP, normalize_discipline
 
-    normalized = normalize_discipline(discipline)
-    params = MCSI_PARAMS.get(normalized)
+logger = logging.getLogger(__name__)
 
-    if not params:
-        return None
+bp = Blueprint('main', __name__)
 
-    # Apply 60→50 conversion if needed
-    if state_code and year and needs_60_to_50_conversion(state_code, year, discipline):
-        score, _ = convert_60_to_50(score, shots_raw)
-        if score is None:
-            return None
+# Rendered aggregate/event pages and shooter trends, keyed by identity and data version
+fragments = FragmentCache(max_bytes=int(os.getenv('FRAGMENT_CACHE_BYTES', 64 * 1024 * 1024)))
 
-    points = int(score)
-    centres = round((score % 1) * 10)
-    mcsi = ((points + centres) * params['multiplier']) + params['offset']
-    return round(mcsi, 2)
+# Last good result of the expensive reports, refreshed in the background
+report_store = ReportStore(max_workers=int(os.getenv('REPORT_WORKERS', 2)))
+PRECOMPUTE_REPORTS = os.getenv('PRECOMPUTE_REPORTS') == '1'
+WARM_REPORTS = os.getenv('WARM_REPORTS') == '1'
 
+# Events in the rolling MCSI average on the shooter trends chart
+TREND_WINDOW = int(os.getenv('TREND_WINDOW', 5))
 
-def normalize_discipline(disc):
-    """Normalize discipline name."""
-    return DISCIPLINE_MAP.get(disc, disc)
+# States, competitions and disciplines, reloaded when the data version changes
+_reference = {'data': None}
 
 
 def get_db():
-    return get_connection()
+    return get_pooled_connection()
 
 
-@app.route('/')
-def index():
-    """Home page with state/year selection."""
+def load_reference_data():
+    """Load the small lookup tables most pages need."""
+    version = data_version()
     conn = get_db()
     cur = conn.cursor()
 
@@ -151,30 +59,54 @@ def index():
             'years': years
         })
 
+    cur.execute('''
+        SELECT c.competition_id, s.code, s.name, c.year
+        FROM competitions c
+        JOIN states s ON c.state_id = s.state_id;
+    ''')
+    competitions = {(code, year): (comp_id, code, name, year)
+                    for comp_id, code, name, year in cur.fetchall()}
+
     conn.close()
-    return render_template('index.html', states=states)
+    return {
+        'version': version,
+        'states': states,
+        'competitions': competitions,
+        'disciplines': dict(DISCIPLINE_MAP),
+    }
 
 
-@app.route('/competition/<state_code>/<int:year>')
-def competition(state_code, year):
-    """Show competition details."""
-    conn = get_db()
-    cur = conn.cursor()
+def reference_data():
+    data = _reference['data']
+    if data is None or data['version'] != data_version():
+        data = _reference['data'] = load_reference_data()
+    return data
 
-    # Get competition
-    cur.execute('''
-        SELECT c.competition_id, s.code, s.name, c.year
-        FROM competitions c
-        JOIN states s ON c.state_id = s.state_id
-        WHERE s.code = %s AND c.year = %s;
-    ''', (state_code, year))
 
-    comp = cur.fetchone()
+@bp.before_app_request
+def start_report_worker():
+    if PRECOMPUTE_REPORTS:
+        report_store.start(report_jobs)
+
+
+@bp.route('/')
+def index():
+    """Home page with state/year selection."""
+    return render_template('index.html', states=reference_data()['states'])
+
+
+@bp.route('/competition/<state_code>/<int:year>')
+def competition(state_code, year):
+    """Show competition details."""
+    comp = reference_data()['competitions'].get((state_code, year))
     if not comp:
         return "Competition not found", 404
 
     comp_id, code, state_name, year = comp
 
+    conn = get_db()
+    cur = conn.cursor()
+
     # Get unique match names (aggregate types)
     cur.execute('''
         SELECT DISTINCT match_name, match_number
@@ -221,9 +153,17 @@ def competition(state_code, year):
                            disciplines=disciplines)
 
 
-@app.route('/aggregate/<int:comp_id>/<path:match_name>')
+@bp.route('/aggregate/<int:comp_id>/<path:match_name>')
 def aggregate_results(comp_id, match_name):
     """Show aggregate results."""
+    # The whole page is cached, not each discipline's table: every table
+    # comes from one query, and data_version() is global, so per-discipline
+    # fragments would be invalidated together anyway
+    cache_key = ('aggregate', comp_id, match_name, data_version())
+    html = fragments.get(cache_key)
+    if html is not None:
+        return html
+
     conn = get_db()
     cur = conn.cursor()
 
@@ -265,13 +205,15 @@ def aggregate_results(comp_id, match_name):
 
     conn.close()
 
-    return render_template('aggregate.html',
+    html = render_template('aggregate.html',
                            comp_info=comp_info,
                            match_name=match_name,
                            results=results_by_discipline)
+    fragments.set(cache_key, html)
+    return html
 
 
-@app.route('/shooter/<int:sid>')
+@bp.route('/shooter/<int:sid>')
 def shooter_profile(sid):
     """Show shooter profile and history."""
     conn = get_db()
@@ -287,6 +229,7 @@ def shooter_profile(sid):
 
     shooter = cur.fetchone()
     if not shooter:
+        conn.close()
         return "Shooter not found", 404
 
     shooter_info = {
@@ -297,15 +240,21 @@ def shooter_profile(sid):
         'club': shooter[4]
     }
 
-    # Get aggregate results
-    cur.execute('''
-        SELECT s.code, c.year, a.match_name, a.discipline, a.place, a.score
+    # Get aggregate results, optionally by percentile and/or strong fields only
+    sort = request.args.get('sort', 'year')
+    min_field = request.args.get('min_field', 0, type=int)
+    order_by = 'a.percentile DESC NULLS LAST, c.year DESC' if sort == 'percentile' \
+        else 'c.year DESC, s.code, a.match_name'
+
+    cur.execute(f'''
+        SELECT s.code, c.year, a.match_name, a.discipline, a.place, a.score,
+               a.field_size, a.percentile
         FROM aggregates a
         JOIN competitions c ON a.competition_id = c.competition_id
         JOIN states s ON c.state_id = s.state_id
-        WHERE a.shooter_sid = %s
-        ORDER BY c.year DESC, s.code, a.match_name;
-    ''', (sid,))
+        WHERE a.shooter_sid = %s AND COALESCE(a.field_size, 0) >= %s
+        ORDER BY {order_by};
+    ''', (sid, min_field))
 
     aggregates = []
     for row in cur.fetchall():
@@ -315,7 +264,9 @@ def shooter_profile(sid):
             'match': row[2],
             'discipline': normalize_discipline(row[3]),
             'place': row[4],
-            'score': row[5]
+            'score': row[5],
+            'field_size': row[6],
+            'percentile': float(row[7]) if row[7] is not None else None
         })
 
     # Get shot statistics
@@ -330,23 +281,50 @@ def shooter_profile(sid):
 
     shot_stats = {row[0]: row[1] for row in cur.fetchall()}
 
+    # Get rating history
+    cur.execute('''
+        SELECT s.code, c.year, rs.rating_before, rs.rating
+        FROM rating_snapshots rs
+        JOIN competitions c ON rs.competition_id = c.competition_id
+        JOIN states s ON c.state_id = s.state_id
+        WHERE rs.sid = %s
+        ORDER BY c.year, c.competition_id;
+    ''', (sid,))
+
+    rating_history = []
+    for row in cur.fetchall():
+        rating_history.append({
+            'state': row[0],
+            'year': row[1],
+            'before': float(row[2]),
+            'rating': float(row[3])
+        })
+
     conn.close()
 
     return render_template('shooter.html',
                            shooter=shooter_info,
                            aggregates=aggregates,
-                           shot_stats=shot_stats)
+                           shot_stats=shot_stats,
+                           rating_history=rating_history,
+                           sort=sort,
+                           min_field=min_field)
 
 
-@app.route('/reports')
+@bp.route('/reports')
 def reports():
     """Reports page."""
     return render_template('reports.html')
 
 
-@app.route('/event/<int:comp_id>/mcsi')
+@bp.route('/event/<int:comp_id>/mcsi')
 def event_mcsi(comp_id):
     """Event page showing all shooters ranked by MCSI regardless of discipline."""
+    cache_key = ('event_mcsi', comp_id, data_version())
+    html = fragments.get(cache_key)
+    if html is not None:
+        return html
+
     conn = get_db()
     cur = conn.cursor()
 
@@ -365,122 +343,122 @@ def event_mcsi(comp_id):
 
     comp_id, state_code, state_name, year = comp
 
-    # Get only Kings/Queens strings for this competition (using pre-calculated flag)
+    # Rankings are snapshotted at import time (see event_mcsi.py)
     cur.execute('''
-        SELECT st.string_id, sh.sid, sh.first_name, sh.last_name, cl.club_name,
-               st.discipline, st.distance, st.distance_unit, st.score, st.match_name, st.shots_raw
-        FROM strings st
-        JOIN shooters sh ON st.shooter_sid = sh.sid
+        SELECT e.string_id, e.sid, sh.first_name, sh.last_name, cl.club_name,
+               e.discipline, e.distance, e.score::float8, e.score_50::float8,
+               e.converted, e.mcsi::float8, e.match_name
+        FROM event_mcsi_strings e
+        JOIN shooters sh ON e.sid = sh.sid
         LEFT JOIN clubs cl ON sh.club_id = cl.club_id
-        WHERE st.competition_id = %s AND st.score IS NOT NULL
-          AND st.is_kings_queens = TRUE
-        ORDER BY sh.last_name, sh.first_name;
+        WHERE e.competition_id = %s
+        ORDER BY e.rank
+        LIMIT 50;
     ''', (comp_id,))
+    top_strings = [
+        {'string_id': string_id, 'sid': sid, 'name': f"{first} {last}", 'club': club,
+         'discipline': disc, 'distance': distance, 'score': score, 'score_50': score_50,
+         'converted': converted, 'mcsi': mcsi, 'match': match_name}
+        for string_id, sid, first, last, club, disc, distance, score, score_50,
+            converted, mcsi, match_name in cur.fetchall()
+    ]
 
-    # Calculate MCSI for each string
-    all_strings = []
-    for row in cur.fetchall():
-        string_id, sid, first, last, club, disc, distance, unit, score, match_name, shots_raw = row
-
-        # Check if 60→50 conversion needed
-        needs_conversion = needs_60_to_50_conversion(state_code, year, disc)
-        display_score = score
-        if needs_conversion and shots_raw:
-            display_score, _ = convert_60_to_50(score, shots_raw)
-
-        mcsi = calculate_mcsi(score, disc, state_code, year, shots_raw)
-        if mcsi:
-            all_strings.append({
-                'string_id': string_id,
-                'sid': sid,
-                'name': f"{first} {last}",
-                'club': club,
-                'discipline': normalize_discipline(disc),
-                'distance': f"{distance}{unit}" if distance else '',
-                'score': float(score),
-                'score_50': float(display_score) if display_score else None,
-                'converted': needs_conversion,
-                'mcsi': mcsi,
-                'match': match_name
-            })
-
-    # Sort by MCSI descending
-    all_strings.sort(key=lambda x: x['mcsi'], reverse=True)
-
-    # Also aggregate by shooter - best MCSI and average
-    shooter_stats = {}
-    for s in all_strings:
-        sid = s['sid']
-        if sid not in shooter_stats:
-            shooter_stats[sid] = {
-                'sid': sid,
-                'name': s['name'],
-                'club': s['club'],
-                'scores': [],
-                'disciplines': set()
-            }
-        shooter_stats[sid]['scores'].append(s['mcsi'])
-        shooter_stats[sid]['disciplines'].add(s['discipline'])
-
-    # Calculate stats
-    shooter_list = []
-    for sid, data in shooter_stats.items():
-        scores = data['scores']
-        shooter_list.append({
-            'sid': data['sid'],
-            'name': data['name'],
-            'club': data['club'],
-            'total_mcsi': round(sum(scores), 2),
-            'avg_mcsi': round(sum(scores) / len(scores), 2),
-            'shoots': len(scores),
-            'disciplines': sorted(data['disciplines'])
-        })
-
-    # Sort by total MCSI descending
-    shooter_list.sort(key=lambda x: x['total_mcsi'], reverse=True)
+    cur.execute('''
+        SELECT e.sid, sh.first_name, sh.last_name, cl.club_name,
+               e.total_mcsi::float8, e.avg_mcsi::float8, e.shoots, e.disciplines
+        FROM event_mcsi_shooters e
+        JOIN shooters sh ON e.sid = sh.sid
+        LEFT JOIN clubs cl ON sh.club_id = cl.club_id
+        WHERE e.competition_id = %s
+        ORDER BY e.rank;
+    ''', (comp_id,))
+    shooter_list = [
+        {'sid': sid, 'name': f"{first} {last}", 'club': club, 'total_mcsi': total,
+         'avg_mcsi': avg, 'shoots': shoots, 'disciplines': disciplines}
+        for sid, first, last, club, total, avg, shoots, disciplines in cur.fetchall()
+    ]
 
     conn.close()
 
-    return render_template('event_mcsi.html',
+    html = render_template('event_mcsi.html',
                            state_code=state_code,
                            state_name=state_name,
                            year=year,
                            comp_id=comp_id,
                            shooters=shooter_list,
-                           top_strings=all_strings[:50])
+                           top_strings=top_strings)
+    fragments.set(cache_key, html)
+    return html
 
 
-@app.route('/api/report/top-shooters')
+@bp.route('/api/report/top-shooters')
 def report_top_shooters():
     """Top shooters by discipline across years."""
+    discipline = request.args.get('discipline', 'TR-A')
+    return jsonify(report_store.get(('top-shooters', discipline),
+                                    lambda: compute_top_shooters(discipline)))
+
+
+def compute_top_shooters(discipline):
     conn = get_db()
     cur = conn.cursor()
 
-    discipline = request.args.get('discipline', 'TR-A')
+    # Totals are kept up to date by the importer (see summaries.py)
+    cur.execute('''
+        SELECT sh.sid, sh.first_name, sh.last_name, cl.club_name,
+               g.wins, g.podiums,
+               g.score_sum / NULLIF(g.scored_entries, 0) as avg_score,
+               g.entries
+        FROM shooter_grand_stats g
+        JOIN shooters sh ON g.sid = sh.sid
+        LEFT JOIN clubs cl ON sh.club_id = cl.club_id
+        WHERE g.norm_discipline = %s
+          AND g.entries >= 3
+        ORDER BY g.wins DESC, g.podiums DESC, avg_score DESC NULLS FIRST
+        LIMIT 50;
+    ''', (discipline,))
 
-    # Map normalized discipline back to originals
-    original_discs = [k for k, v in DISCIPLINE_MAP.items() if v == discipline]
-    if not original_discs:
-        original_discs = [discipline]
+    results = []
+    for row in cur.fetchall():
+        results.append({
+            'sid': row[0],
+            'name': f"{row[1]} {row[2]}",
+            'club': row[3],
+            'wins': row[4],
+            'podiums': row[5],
+            'avg_score': float(row[6]) if row[6] else 0,
+            'entries': row[7]
+        })
 
-    placeholders = ','.join(['%s'] * len(original_discs))
+    conn.close()
+    return results
 
-    cur.execute(f'''
+
+@bp.route('/api/report/field-strength')
+def report_field_strength():
+    """Shooters ranked by average Grand Aggregate percentile in large fields."""
+    conn = get_db()
+    cur = conn.cursor()
+
+    discipline = request.args.get('discipline', 'TR-A')
+    min_field = request.args.get('min_field', 10, type=int)
+
+    cur.execute('''
         SELECT sh.sid, sh.first_name, sh.last_name, cl.club_name,
-               COUNT(CASE WHEN a.place = 1 THEN 1 END) as wins,
-               COUNT(CASE WHEN a.place <= 3 THEN 1 END) as podiums,
-               AVG(a.score) as avg_score,
-               COUNT(*) as total_entries
+               AVG(a.percentile) as avg_percentile,
+               AVG(a.field_size) as avg_field,
+               COUNT(*) as entries
         FROM aggregates a
         JOIN shooters sh ON a.shooter_sid = sh.sid
         LEFT JOIN clubs cl ON sh.club_id = cl.club_id
-        WHERE a.discipline IN ({placeholders})
-          AND a.match_name LIKE '%Grand%'
+        WHERE a.norm_discipline = %s
+          AND a.field_size >= %s
+          AND a.is_grand
         GROUP BY sh.sid, sh.first_name, sh.last_name, cl.club_name
         HAVING COUNT(*) >= 3
-        ORDER BY wins DESC, podiums DESC, avg_score DESC
+        ORDER BY avg_percentile DESC
         LIMIT 50;
-    ''', original_discs)
+    ''', (discipline, min_field))
 
     results = []
     for row in cur.fetchall():
@@ -488,36 +466,32 @@ def report_top_shooters():
             'sid': row[0],
             'name': f"{row[1]} {row[2]}",
             'club': row[3],
-            'wins': row[4],
-            'podiums': row[5],
-            'avg_score': float(row[6]) if row[6] else 0,
-            'entries': row[7]
+            'avg_percentile': round(float(row[4]), 1),
+            'avg_field': round(float(row[5]), 1),
+            'entries': row[6]
         })
 
     conn.close()
     return jsonify(results)
 
 
-@app.route('/api/report/discipline-stats')
+@bp.route('/api/report/discipline-stats')
 def report_discipline_stats():
     """Discipline participation over years."""
     conn = get_db()
     cur = conn.cursor()
 
     cur.execute('''
-        SELECT c.year, a.discipline, COUNT(DISTINCT a.shooter_sid) as shooters
-        FROM aggregates a
-        JOIN competitions c ON a.competition_id = c.competition_id
-        WHERE a.match_name LIKE '%Grand%'
-        GROUP BY c.year, a.discipline
-        ORDER BY c.year, a.discipline;
+        SELECT year, norm_discipline, shooters
+        FROM grand_participation
+        ORDER BY year, norm_discipline;
     ''')
 
     results = []
     for row in cur.fetchall():
         results.append({
             'year': row[0],
-            'discipline': normalize_discipline(row[1]),
+            'discipline': row[1],
             'shooters': row[2]
         })
 
@@ -525,17 +499,28 @@ def report_discipline_stats():
     return jsonify(results)
 
 
-@app.route('/api/report/shot-distribution')
+@bp.route('/api/report/shot-distribution')
 def report_shot_distribution():
     """Shot value distribution."""
-    conn = get_db()
-    cur = conn.cursor()
-
     discipline = request.args.get('discipline', 'TR-A')
+    return jsonify(compute_shot_distribution(discipline))
+
+
+def compute_shot_distribution(discipline, use_mirror=True):
     original_discs = [k for k, v in DISCIPLINE_MAP.items() if v == discipline]
     if not original_discs:
         original_discs = [discipline]
 
+    mirror = analytics.open_mirror(data_version()) if use_mirror else None
+    if mirror is not None:
+        try:
+            return analytics.shot_distribution(mirror, original_discs)
+        finally:
+            mirror.close()
+
+    conn = get_db()
+    cur = conn.cursor()
+
     placeholders = ','.join(['%s'] * len(original_discs))
 
     cur.execute(f'''
@@ -549,27 +534,58 @@ def report_shot_distribution():
 
     results = {row[0]: row[1] for row in cur.fetchall()}
     conn.close()
+    return results
+
+
+@bp.route('/api/report/shot-sequence')
+def report_shot_sequence():
+    """Shot values by position in the string, read from the precomputed cube."""
+    discipline = request.args.get('discipline', 'TR-A')
+    year = request.args.get('year', type=int)
+    distance = request.args.get('distance', type=int)
+    distance_unit = request.args.get('unit') or None
+
+    conn = get_db()
+    try:
+        results = sequence_report(conn.cursor(), discipline, year, distance, distance_unit)
+    finally:
+        conn.close()
     return jsonify(results)
 
 
-@app.route('/api/report/mcsi-leaderboard')
+@bp.route('/api/report/mcsi-leaderboard')
 def report_mcsi_leaderboard():
     """MCSI leaderboard - top shooters across all disciplines."""
+    year = request.args.get('year', type=int)
+    return jsonify(report_store.get(('mcsi-leaderboard', year),
+                                    lambda: compute_mcsi_leaderboard(year)))
+
+
+def compute_mcsi_leaderboard(year=None, use_mirror=True):
+    mirror = analytics.open_mirror(data_version()) if use_mirror else None
+    if mirror is not None:
+        try:
+            rows = analytics.leaderboard_rows(mirror, year)
+        finally:
+            mirror.close()
+    else:
+        rows = mcsi_rows(year)
+    return leaderboard_from_rows(rows)
+
+
+def mcsi_rows(year=None):
     conn = get_db()
     cur = conn.cursor()
 
-    year = request.args.get('year', type=int)
-
-    # Get all string scores with disciplines
+    # Get all stored string MCSI values with disciplines
     query = '''
         SELECT sh.sid, sh.first_name, sh.last_name, cl.club_name,
-               st.discipline, st.score, c.year, s.code, st.shots_raw
+               st.discipline, st.mcsi
         FROM strings st
         JOIN shooters sh ON st.shooter_sid = sh.sid
         LEFT JOIN clubs cl ON sh.club_id = cl.club_id
         JOIN competitions c ON st.competition_id = c.competition_id
-        JOIN states s ON c.state_id = s.state_id
-        WHERE st.score IS NOT NULL
+        WHERE st.mcsi IS NOT NULL
     '''
     params = []
 
@@ -578,14 +594,17 @@ def report_mcsi_leaderboard():
         params.append(year)
 
     cur.execute(query, params)
+    rows = cur.fetchall()
+    conn.close()
+    return rows
 
-    # Calculate MCSI for each score and aggregate by shooter
-    shooter_scores = {}
-    for sid, first, last, club, disc, score, yr, state_code, shots_raw in cur.fetchall():
-        mcsi = calculate_mcsi(score, disc, state_code, yr, shots_raw)
-        if mcsi is None:
-            continue
 
+def leaderboard_from_rows(rows):
+    """Rank shooters by their top 10 average MCSI (minimum 5 scores)."""
+    # Aggregate MCSI by shooter
+    shooter_scores = {}
+    for sid, first, last, club, disc, mcsi in rows:
+        mcsi = float(mcsi)
         if sid not in shooter_scores:
             shooter_scores[sid] = {
                 'sid': sid,
@@ -610,66 +629,473 @@ def report_mcsi_leaderboard():
                 'avg_mcsi': round(avg_mcsi, 2),
                 'top_10_avg': round(top_10_avg, 2),
                 'total_scores': len(data['scores']),
-                'disciplines': list(data['disciplines'])
+                'disciplines': sorted(data['disciplines'])
             })
 
-    results.sort(key=lambda x: x['top_10_avg'], reverse=True)
-    conn.close()
-    return jsonify(results[:100])
+    results.sort(key=lambda x: (-x['top_10_avg'], x['sid']))
+    return results[:100]
 
 
-@app.route('/api/report/mcsi-comparison')
-def report_mcsi_comparison():
-    """Compare a shooter's MCSI across disciplines."""
+def report_jobs():
+    """Every (key, compute) pair the background worker keeps warm."""
     conn = get_db()
     cur = conn.cursor()
+    cur.execute('SELECT DISTINCT year FROM competitions ORDER BY year;')
+    years = [row[0] for row in cur.fetchall()]
+    conn.close()
+
+    jobs = [(('mcsi-leaderboard', None), compute_mcsi_leaderboard)]
+    for year in years:
+        jobs.append((('mcsi-leaderboard', year), partial(compute_mcsi_leaderboard, year)))
+    for discipline in sorted(set(DISCIPLINE_MAP.values())):
+        jobs.append((('top-shooters', discipline), partial(compute_top_shooters, discipline)))
+    return jobs
+
 
+@bp.route('/api/report/mcsi-comparison')
+def report_mcsi_comparison():
+    """Compare a shooter's MCSI across disciplines."""
     sid = request.args.get('sid', type=int)
     if not sid:
         return jsonify({'error': 'sid required'}), 400
 
+    conn = get_db()
+    cur = conn.cursor()
+
+    # Stored MCSI already reflects each competition's state, year and target
     cur.execute('''
-        SELECT st.discipline, st.score, c.year, s.code
+        SELECT COALESCE(st.norm_discipline, st.discipline), st.score, st.mcsi, c.year, s.code,
+               COUNT(*) OVER d, AVG(st.mcsi) OVER d, MAX(st.mcsi) OVER d
         FROM strings st
         JOIN competitions c ON st.competition_id = c.competition_id
         JOIN states s ON c.state_id = s.state_id
-        WHERE st.shooter_sid = %s AND st.score IS NOT NULL
-        ORDER BY c.year DESC, st.discipline;
+        WHERE st.shooter_sid = %s AND st.mcsi IS NOT NULL
+        WINDOW d AS (PARTITION BY COALESCE(st.norm_discipline, st.discipline))
+        ORDER BY c.year DESC, c.competition_id DESC, st.match_number;
     ''', (sid,))
 
-    by_discipline = {}
-    for disc, score, year, state in cur.fetchall():
-        mcsi = calculate_mcsi(score, disc)
-        if mcsi is None:
-            continue
-
-        norm_disc = normalize_discipline(disc)
-        if norm_disc not in by_discipline:
-            by_discipline[norm_disc] = []
-        by_discipline[norm_disc].append({
+    results = {}
+    for disc, score, mcsi, year, state, count, avg_mcsi, best_mcsi in cur.fetchall():
+        if disc not in results:
+            results[disc] = {
+                'count': count,
+                'avg_mcsi': round(float(avg_mcsi), 2),
+                'best_mcsi': float(best_mcsi),
+                'scores': []
+            }
+        results[disc]['scores'].append({
             'score': float(score),
-            'mcsi': mcsi,
+            'mcsi': float(mcsi),
             'year': year,
             'state': state
         })
 
-    # Calculate stats per discipline
-    results = {}
-    for disc, scores in by_discipline.items():
-        mcsi_values = [s['mcsi'] for s in scores]
-        results[disc] = {
-            'count': len(scores),
-            'avg_mcsi': round(sum(mcsi_values) / len(mcsi_values), 2),
-            'best_mcsi': round(max(mcsi_values), 2),
-            'scores': scores[:20]  # Last 20 scores
-        }
+    conn.close()
+    return jsonify(results)
+
+
+@bp.route('/api/shooter/<int:sid>/trends')
+def shooter_trends(sid):
+    """Per-discipline MCSI trends for one shooter, cached until the data changes."""
+    window = max(request.args.get('window', TREND_WINDOW, type=int), 1)
+    cache_key = ('shooter-trends', sid, window, data_version())
+    body = fragments.get(cache_key)
+    if body is None:
+        body = json.dumps(compute_shooter_trends(sid, window))
+        fragments.set(cache_key, body)
+    return Response(body, mimetype='application/json')
+
+
+def compute_shooter_trends(sid, window=TREND_WINDOW):
+    """Rolling average, best/worst and year-over-year change of event MCSI per discipline."""
+    conn = get_db()
+    cur = conn.cursor()
+
+    # One point per competition and discipline: the shooter's average string MCSI
+    cur.execute('''
+        WITH events AS (
+            SELECT COALESCE(st.norm_discipline, st.discipline) AS discipline,
+                   c.competition_id, c.year, s.code,
+                   AVG(st.mcsi) AS mcsi, MAX(st.mcsi) AS best, MIN(st.mcsi) AS worst,
+                   COUNT(*) AS strings
+            FROM strings st
+            JOIN competitions c ON st.competition_id = c.competition_id
+            JOIN states s ON c.state_id = s.state_id
+            WHERE st.shooter_sid = %s AND st.mcsi IS NOT NULL
+            GROUP BY 1, c.competition_id, c.year, s.code
+        )
+        SELECT discipline, competition_id, year, code, strings,
+               ROUND(mcsi, 2),
+               ROUND(AVG(mcsi) OVER (PARTITION BY discipline ORDER BY year, competition_id
+                                     ROWS BETWEEN %s PRECEDING AND CURRENT ROW), 2),
+               MAX(best) OVER (PARTITION BY discipline),
+               MIN(worst) OVER (PARTITION BY discipline)
+        FROM events
+        ORDER BY discipline, year, competition_id;
+    ''', (sid, window - 1))
+
+    trends = {}
+    for disc, comp_id, year, state, strings, mcsi, rolling, best, worst in cur.fetchall():
+        if disc not in trends:
+            trends[disc] = {'best_mcsi': float(best), 'worst_mcsi': float(worst),
+                            'strings': 0, 'events': [], 'years': []}
+        trends[disc]['strings'] += strings
+        trends[disc]['events'].append({
+            'competition_id': comp_id,
+            'year': year,
+            'state': state,
+            'strings': strings,
+            'mcsi': float(mcsi),
+            'rolling': float(rolling)
+        })
+
+    cur.execute('''
+        SELECT COALESCE(st.norm_discipline, st.discipline) AS discipline, c.year,
+               COUNT(*), ROUND(AVG(st.mcsi), 2),
+               ROUND(AVG(st.mcsi) - LAG(AVG(st.mcsi)) OVER (
+                   PARTITION BY COALESCE(st.norm_discipline, st.discipline) ORDER BY c.year), 2)
+        FROM strings st
+        JOIN competitions c ON st.competition_id = c.competition_id
+        WHERE st.shooter_sid = %s AND st.mcsi IS NOT NULL
+        GROUP BY 1, c.year
+        ORDER BY 1, c.year;
+    ''', (sid,))
+
+    for disc, year, strings, avg_mcsi, delta in cur.fetchall():
+        trends[disc]['years'].append({
+            'year': year,
+            'strings': strings,
+            'avg_mcsi': float(avg_mcsi),
+            'delta': float(delta) if delta is not None else None
+        })
+
+    conn.close()
+    return {'sid': sid, 'window': window, 'disciplines': trends}
+
+
+# Largest number of SIDs one /api/shooters/batch call may ask for
+MAX_BATCH_SIDS = int(os.getenv('MAX_BATCH_SIDS', 500))
+BATCH_FIELDS = ('profile', 'aggregates', 'shot_stats', 'rating')
+
+
+@bp.route('/api/shooters/batch', methods=['GET', 'POST'])
+def shooters_batch():
+    """Profile, aggregate history, shot stats and rating for many shooters.
+
+    Takes sids (and optionally fields) as comma-separated query parameters
+    or as lists in a JSON body. Runs one query per requested field however
+    many SIDs are asked for.
+    """
+    body = request.get_json(silent=True) or {}
+    sids = body.get('sids') or request.args.get('sids', '')
+    fields = body.get('fields') or request.args.get('fields', ','.join(BATCH_FIELDS))
+    if isinstance(sids, str):
+        sids = sids.split(',')
+    if isinstance(fields, str):
+        fields = fields.split(',')
+
+    try:
+        sids = sorted({int(sid) for sid in sids if str(sid).strip()})
+    except (TypeError, ValueError):
+        return jsonify({'error': 'sids must be integers'}), 400
+    fields = [f.strip() for f in fields if f.strip()]
+    unknown = [f for f in fields if f not in BATCH_FIELDS]
+    if not sids:
+        return jsonify({'error': 'sids required'}), 400
+    if len(sids) > MAX_BATCH_SIDS:
+        return jsonify({'error': f'at most {MAX_BATCH_SIDS} sids per request'}), 400
+    if unknown:
+        return jsonify({'error': f"unknown fields: {', '.join(unknown)}",
+                        'fields': list(BATCH_FIELDS)}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+
+    # Always resolve the shooters so unknown SIDs can be reported
+    cur.execute('''
+        SELECT sh.sid, sh.first_name, sh.last_name, sh.pref_name, cl.club_name
+        FROM shooters sh
+        LEFT JOIN clubs cl ON sh.club_id = cl.club_id
+        WHERE sh.sid = ANY(%s);
+    ''', (sids,))
+    shooters = {}
+    for sid, first_name, last_name, pref_name, club in cur.fetchall():
+        shooters[sid] = {'sid': sid}
+        if 'profile' in fields:
+            shooters[sid]['profile'] = {
+                'first_name': first_name,
+                'last_name': last_name,
+                'pref_name': pref_name,
+                'club': club
+            }
+    found = sorted(shooters)
+
+    if 'aggregates' in fields:
+        for sid in found:
+            shooters[sid]['aggregates'] = []
+        cur.execute('''
+            SELECT a.shooter_sid, s.code, c.year, a.match_name, a.norm_discipline, a.place,
+                   a.score, a.field_size, a.percentile
+            FROM aggregates a
+            JOIN competitions c ON a.competition_id = c.competition_id
+            JOIN states s ON c.state_id = s.state_id
+            WHERE a.shooter_sid = ANY(%s)
+            ORDER BY a.shooter_sid, c.year DESC, s.code, a.match_name;
+        ''', (found,))
+        for sid, code, year, match, disc, place, score, field_size, percentile in cur.fetchall():
+            shooters[sid]['aggregates'].append({
+                'state': code,
+                'year': year,
+                'match': match,
+                'discipline': disc,
+                'place': place,
+                'score': float(score) if score is not None else None,
+                'field_size': field_size,
+                'percentile': float(percentile) if percentile is not None else None
+            })
+
+    if 'shot_stats' in fields:
+        for sid in found:
+            shooters[sid]['shot_stats'] = {}
+        cur.execute('''
+            SELECT st.shooter_sid, sh.shot_value, COUNT(*)
+            FROM shots sh
+            JOIN strings st ON sh.string_id = st.string_id
+            WHERE st.shooter_sid = ANY(%s)
+            GROUP BY st.shooter_sid, sh.shot_value;
+        ''', (found,))
+        for sid, shot_value, count in cur.fetchall():
+            shooters[sid]['shot_stats'][shot_value] = count
+
+    if 'rating' in fields:
+        for sid in found:
+            shooters[sid]['rating'] = None
+        cur.execute('''
+            SELECT sid, rating, events FROM shooter_ratings WHERE sid = ANY(%s);
+        ''', (found,))
+        for sid, rating, events in cur.fetchall():
+            shooters[sid]['rating'] = {'rating': float(rating), 'events': events}
+
+    conn.close()
+    return jsonify({
+        'shooters': [shooters[sid] for sid in found],
+        'missing': [sid for sid in sids if sid not in shooters]
+    })
+
+
+# How many shooters one head-to-head comparison may include
+MAX_HEAD_TO_HEAD = 10
+
+
+def parse_sids(value):
+    """Comma-separated SIDs from a query parameter, in order and de-duplicated."""
+    sids = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if part.isdigit() and int(part) not in sids:
+            sids.append(int(part))
+    return sids
+
+
+def compute_head_to_head(sids):
+    conn = get_db()
+    cur = conn.cursor()
+
+    cur.execute('''
+        SELECT sh.sid, sh.first_name, sh.last_name, cl.club_name
+        FROM shooters sh
+        LEFT JOIN clubs cl ON sh.club_id = cl.club_id
+        WHERE sh.sid = ANY(%s);
+    ''', (sids,))
+    found = {row[0]: {'sid': row[0], 'name': f"{row[1]} {row[2]}", 'club': row[3]}
+             for row in cur.fetchall()}
+    shooters = [found[sid] for sid in sids if sid in found]
+
+    matches, pairs = compare(load_results(cur, [s['sid'] for s in shooters]))
+    conn.close()
+
+    # Group shared matches under their competitions
+    competitions = {comp[0]: comp for comp in reference_data()['competitions'].values()}
+    shared = {}
+    for match in matches:
+        comp_id = match.pop('competition_id')
+        if comp_id not in shared:
+            _, code, state_name, year = competitions.get(comp_id, (comp_id, None, None, None))
+            shared[comp_id] = {'competition_id': comp_id, 'state': code, 'year': year, 'matches': []}
+        shared[comp_id]['matches'].append(match)
+
+    return {
+        'shooters': shooters,
+        'missing': [sid for sid in sids if sid not in found],
+        'competitions': sorted(shared.values(), key=lambda c: (c['year'] or 0, c['state'] or ''),
+                               reverse=True),
+        'pairs': pairs,
+    }
+
+
+@bp.route('/api/report/head-to-head')
+def report_head_to_head():
+    """Shared events, win/loss records and score/MCSI deltas for two or more shooters."""
+    sids = parse_sids(request.args.get('sids'))
+    if not 2 <= len(sids) <= MAX_HEAD_TO_HEAD:
+        return jsonify({'error': f'between 2 and {MAX_HEAD_TO_HEAD} sids required'}), 400
+    return jsonify(compute_head_to_head(sids))
+
+
+@bp.route('/head-to-head')
+def head_to_head():
+    """Head-to-head comparison page."""
+    sids = parse_sids(request.args.get('sids'))[:MAX_HEAD_TO_HEAD]
+    result = compute_head_to_head(sids) if len(sids) >= 2 else None
+    return render_template('head_to_head.html', sids=sids, result=result)
+
+
+@bp.route('/api/report/ratings')
+def report_ratings():
+    """Rating leaderboard."""
+    conn = get_db()
+    cur = conn.cursor()
+
+    min_events = request.args.get('min_events', 3, type=int)
+
+    cur.execute('''
+        SELECT sh.sid, sh.first_name, sh.last_name, cl.club_name, r.rating, r.events
+        FROM shooter_ratings r
+        JOIN shooters sh ON r.sid = sh.sid
+        LEFT JOIN clubs cl ON sh.club_id = cl.club_id
+        WHERE r.events >= %s
+        ORDER BY r.rating DESC
+        LIMIT 100;
+    ''', (min_events,))
+
+    results = []
+    for row in cur.fetchall():
+        results.append({
+            'sid': row[0],
+            'name': f"{row[1]} {row[2]}",
+            'club': row[3],
+            'rating': float(row[4]),
+            'events': row[5]
+        })
 
     conn.close()
     return jsonify(results)
 
 
+@bp.route('/api/export')
+def api_export():
+    """Stream one table as Arrow IPC or Parquet, optionally filtered by year/state."""
+    import data_export
+
+    table = request.args.get('table', 'strings')
+    fmt = request.args.get('format', 'arrow')
+    year = request.args.get('year', type=int)
+    state_code = request.args.get('state')
+    if table not in data_export.TABLES or fmt not in data_export.FORMATS:
+        return jsonify({'error': f"table must be one of {sorted(data_export.TABLES)}, "
+                                 f"format one of {sorted(data_export.FORMATS)}"}), 400
+    try:
+        data_export.get_pyarrow()
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 501
+
+    conn = get_db()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT c.competition_id
+        FROM competitions c
+        JOIN states s ON c.state_id = s.state_id
+        WHERE (%s IS NULL OR c.year = %s) AND (%s IS NULL OR s.code = %s)
+        ORDER BY c.year, s.code;
+    ''', (year, year, state_code, state_code))
+    competition_ids = [row[0] for row in cur.fetchall()]
+
+    def generate():
+        try:
+            yield from data_export.stream_table(conn, table, competition_ids, fmt)
+        finally:
+            conn.close()
+
+    mimetype = 'application/vnd.apache.arrow.stream' if fmt == 'arrow' else 'application/octet-stream'
+    filename = f"{table}.{'arrows' if fmt == 'arrow' else 'parquet'}"
+    return Response(generate(), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@bp.route('/api/cache/stats')
+def cache_stats():
+    """Cache counters for this worker."""
+    return jsonify({'data_version': data_version(),
+                    'fragments': fragments.stats(),
+                    'reports': report_store.stats()})
+
+
+def warm_up(app):
+    """Build everything that can be shared read-only before workers fork.
+
+    The database steps are best-effort: if they fail the app still starts
+    and the caches fill on first use.
+    """
+    started = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    logger.info("Compiled %d templates in %.2fs",
+                len(app.jinja_env.list_templates()), time.perf_counter() - started)
+
+    step = time.perf_counter()
+    try:
+        reference = reference_data()
+    except Exception:
+        logger.exception("Could not load reference data during warm-up; loading it on first request")
+        return
+    logger.info("Loaded reference data (%d states, %d competitions) in %.2fs",
+                len(reference['states']), len(reference['competitions']),
+                time.perf_counter() - step)
+
+    if WARM_REPORTS:
+        step = time.perf_counter()
+        try:
+            jobs = report_jobs()
+            for key, compute in jobs:
+                report_store.get(key, compute)
+        except Exception:
+            logger.exception("Could not prime reports during warm-up; computing them on demand")
+            return
+        logger.info("Primed %d reports in %.2fs", len(jobs), time.perf_counter() - step)
+
+
+def warm_worker():
+    """Per-process warm-up, run in each worker after fork."""
+    started = time.perf_counter()
+    try:
+        get_pool()
+    except Exception:
+        logger.exception("Could not open the connection pool in worker %d; retrying on first request",
+                         os.getpid())
+    if PRECOMPUTE_REPORTS:
+        report_store.start(report_jobs)
+    logger.info("Worker %d ready in %.2fs", os.getpid(), time.perf_counter() - started)
+
+
+def create_app():
+    """Create the Flask app, warming it up unless APP_WARM_UP=0."""
+    started = time.perf_counter()
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    profiling.init_app(app)
+    if os.getenv('APP_WARM_UP', '1') != '0':
+        warm_up(app)
+    logger.info("App created in %.2fs", time.perf_counter() - started)
+    return app
+
+
+app = create_app()
+
+
 if __name__ == '__main__':
-    import os
     port = int(os.getenv('PORT', 5001))
     debug = os.getenv('FLASK_ENV') != 'production'
     app.run(host='0.0.0.0', port=port, debug=debug)
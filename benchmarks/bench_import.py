@@ -0,0 +1,119 @@
+"""Measure throughput and peak memory of the import pipeline.
+
+Generates synthetic result CSVs of increasing size and runs them through
+the read -> parse -> match -> route stages of import_results, scoring with
+the default MCSI parameters, without connecting to a database. Each size
+runs in a fresh process so peak RSS is comparable; it should stay flat as
+the file grows.
+
+Usage:
+    python benchmarks/bench_import.py [--rows 100000 200000 400000]
+"""
+import argparse
+import csv
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEADER = ['competition', 'match_number', 'match_name', 'distance', 'distance_unit',
+          'discipline', 'place', 'full_name', 'last_name', 'first_name', 'club',
+          'state', 'shots', 'info', 'score']
+STATES = ['QRA', 'NSWRA', 'VRA', 'WARA', 'SARA']
+SHOOTERS = 2000
+
+
+def write_csv(path, rows):
+    from scoring import DISCIPLINE_MAP
+
+    # Raw names as they appear in results files, so every row is normalized and scored
+    disciplines = sorted(DISCIPLINE_MAP)
+    rng = random.Random(rows)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for i in range(rows):
+            n = rng.randrange(SHOOTERS)
+            first, last, club = f'First{n}', f'Last{n}', f'Club{n % 50}'
+            state = STATES[n % len(STATES)]
+            if i % 10 == 0:
+                writer.writerow([f'{state} 2025', 99, 'Grand Aggregate', '', '',
+                                 rng.choice(disciplines), rng.randint(1, 200),
+                                 f'{first} {last}', last, first, club, state, '', '',
+                                 f'{rng.uniform(300, 450):.3f}'])
+            else:
+                shots = ''.join(rng.choice('456VX') for _ in range(12))
+                writer.writerow([f'{state} 2025', i % 12 + 1, f'Match {i % 12 + 1}',
+                                 rng.choice([300, 500, 600, 800]), 'm',
+                                 rng.choice(disciplines), rng.randint(1, 200),
+                                 f'{first} {last}', last, first, club, state,
+                                 shots, '', f'{rng.uniform(40, 60):.3f}'])
+
+
+def run_once(path):
+    """Consume the pipeline for one file and print rows, seconds and peak RSS."""
+    # Never fall back to the production database if something does connect
+    os.environ['DATABASE_URL'] = 'postgresql://bench-import.invalid/none'
+    import import_results
+    import mcsi_params
+
+    lookup = {}
+    name_only_lookup = {}
+    for n in range(SHOOTERS):
+        key = (f'first{n}', f'last{n}')
+        if n % 3:
+            lookup[key + (f'club{n % 50}',)] = n
+        name_only_lookup[key] = n
+
+    competitions = {}
+
+    def resolve_competition(name):
+        state_code, year = import_results.parse_competition_name(name)
+        comp_id = competitions.setdefault(name, len(competitions) + 1)
+        return comp_id, state_code, year
+
+    # MCSI parameters and 60-point rules come from the database in production;
+    # use the seeded defaults so scoring runs for real without connecting
+    params = [(mcsi_params.DEFAULT_YEAR, mcsi_params.ALL_STATES, disc, p['multiplier'], p['offset'])
+              for disc, p in mcsi_params.DEFAULT_PARAMS.items()]
+    mcsi_params._current.update(table=mcsi_params.ParamTable(params, mcsi_params.DEFAULT_CONVERSIONS),
+                                loaded_at=float('inf'))
+
+    start = time.perf_counter()
+    rows = 0
+    for batch in import_results.pipeline(path, 0, resolve_competition, lookup, name_only_lookup,
+                                         import_results.CHUNK_ROWS):
+        rows += len(batch)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{rows} {elapsed:.3f} {peak_kb}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming import pipeline.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 200000, 400000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'seconds':>9} {'rows/s':>10} {'file MB':>9} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, f'results-{rows}.csv')
+            write_csv(path, rows)
+            out = subprocess.run([sys.executable, __file__, '--run', path],
+                                 check=True, capture_output=True, text=True).stdout
+            count, elapsed, peak_kb = out.split()
+            count, elapsed, peak_kb = int(count), float(elapsed), int(peak_kb)
+            print(f"{count:>10} {elapsed:>9.2f} {count / elapsed:>10.0f} "
+                  f"{os.path.getsize(path) / 1e6:>9.1f} {peak_kb / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == '--run':
+        run_once(sys.argv[2])
+    else:
+        main()
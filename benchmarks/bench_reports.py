@@ -0,0 +1,67 @@
+"""Compare report latency against Postgres and the SQLite analytics mirror.
+
+Syncs the mirror at ANALYTICS_DB (default ./analytics.sqlite3), then times
+the MCSI leaderboard and shot-distribution reports from each source and
+checks that both return the same JSON.
+
+Usage:
+    DATABASE_URL=... python benchmarks/bench_reports.py [--runs 20] [--year 2025]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ANALYTICS_DB', os.path.abspath('analytics.sqlite3'))
+os.environ.setdefault('APP_WARM_UP', '0')
+
+import analytics  # noqa: E402
+import app  # noqa: E402
+from db import get_connection  # noqa: E402
+
+
+def timed(fn, runs):
+    times = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+    times.sort()
+    return result, statistics.median(times), times[int(len(times) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reports on Postgres vs the analytics mirror.")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--year', type=int, default=None)
+    parser.add_argument('--discipline', default='TR-A')
+    args = parser.parse_args()
+
+    conn = get_connection()
+    started = time.perf_counter()
+    analytics.sync(conn, analytics.ANALYTICS_DB)
+    conn.close()
+    print(f"Synced mirror {analytics.ANALYTICS_DB} in {time.perf_counter() - started:.2f}s\n")
+
+    reports = [
+        ('mcsi-leaderboard', lambda mirror: app.compute_mcsi_leaderboard(args.year, use_mirror=mirror)),
+        ('shot-distribution', lambda mirror: app.compute_shot_distribution(args.discipline, use_mirror=mirror)),
+    ]
+
+    print(f"{'report':<20} {'source':<10} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, run in reports:
+        outputs = {}
+        for source, mirror in (('postgres', False), ('sqlite', True)):
+            result, p50, p95 = timed(lambda: run(mirror), args.runs)
+            outputs[source] = json.dumps(result, sort_keys=True)
+            print(f"{name:<20} {source:<10} {p50:>9.1f} {p95:>9.1f}")
+        if outputs['postgres'] != outputs['sqlite']:
+            print(f"  WARNING: {name} output differs between sources")
+
+
+if __name__ == "__main__":
+    main()
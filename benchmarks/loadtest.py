@@ -0,0 +1,329 @@
+"""Concurrent HTTP load test of the app under gunicorn.
+
+Starts gunicorn (gunicorn.conf.py, so preload and post-fork warm-up are
+the same as production) against a local Postgres, then replays a
+weighted mix of real routes from --concurrency client threads for
+--duration seconds. Routes are filled in from the database, and most
+traffic goes to the latest competition, as when results go live.
+
+Reports throughput, p50/p95/p99 latency and error rate per route, and
+samples pg_stat_activity once a second for connection counts.
+
+The database must already hold results: restore a dump with --restore,
+or load it with import_shooters.py and import_results.py. Only local
+databases are accepted unless --allow-remote is given.
+
+Usage:
+    python benchmarks/loadtest.py --database-url postgresql://localhost/nraa \\
+        [--restore dump.sql] [--workers 4] [--concurrency 100] [--duration 60]
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (route label, weight); API reports share the remaining weight
+ROUTE_MIX = [
+    ('/aggregate/<comp_id>/<match_name>', 30),
+    ('/event/<comp_id>/mcsi', 20),
+    ('/competition/<state>/<year>', 15),
+    ('/shooter/<sid>', 15),
+    ('/', 5),
+    ('/api/report/mcsi-leaderboard', 4),
+    ('/api/report/top-shooters', 3),
+    ('/api/report/discipline-stats', 3),
+    ('/api/report/shot-distribution', 3),
+    ('/api/report/field-strength', 2),
+]
+LIVE_SHARE = 0.8  # share of competition-specific traffic aimed at the latest competition
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1', '')
+
+
+def restore(database_url, dump):
+    tool = 'pg_restore' if not dump.endswith('.sql') else 'psql'
+    command = [tool, '--dbname', database_url]
+    command += ['--no-owner', '--clean', '--if-exists', dump] if tool == 'pg_restore' else ['-q', '-f', dump]
+    print(f"Restoring {dump} with {tool}...")
+    subprocess.run(command, check=True)
+
+
+def load_targets(database_url):
+    """Real ids and names to substitute into the route templates."""
+    conn = psycopg2.connect(database_url)
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT c.competition_id, s.code, c.year
+        FROM competitions c JOIN states s ON c.state_id = s.state_id
+        ORDER BY c.year DESC, c.competition_id DESC;
+    ''')
+    competitions = cur.fetchall()
+    if not competitions:
+        raise SystemExit("The database has no competitions; seed it first.")
+
+    cur.execute('''
+        SELECT competition_id, array_agg(DISTINCT match_name)
+        FROM aggregates GROUP BY competition_id;
+    ''')
+    matches = dict(cur.fetchall())
+
+    cur.execute('''
+        SELECT competition_id, array_agg(DISTINCT shooter_sid)
+        FROM aggregates GROUP BY competition_id;
+    ''')
+    shooters = dict(cur.fetchall())
+
+    cur.execute("SELECT DISTINCT norm_discipline FROM aggregates WHERE norm_discipline IS NOT NULL;")
+    disciplines = [row[0] for row in cur.fetchall()] or ['TR-A']
+    cur.execute("SELECT DISTINCT year FROM competitions;")
+    years = [row[0] for row in cur.fetchall()]
+    conn.close()
+
+    competitions = [c for c in competitions if matches.get(c[0])]
+    return {
+        'competitions': competitions,
+        'matches': matches,
+        'shooters': shooters,
+        'disciplines': disciplines,
+        'years': years,
+    }
+
+
+def pick_path(label, targets, rng):
+    if rng.random() < LIVE_SHARE:
+        comp_id, code, year = targets['competitions'][0]
+    else:
+        comp_id, code, year = rng.choice(targets['competitions'])
+
+    if label == '/aggregate/<comp_id>/<match_name>':
+        match = rng.choice(targets['matches'][comp_id])
+        return f"/aggregate/{comp_id}/{urllib.parse.quote(match)}"
+    if label == '/event/<comp_id>/mcsi':
+        return f"/event/{comp_id}/mcsi"
+    if label == '/competition/<state>/<year>':
+        return f"/competition/{code}/{year}"
+    if label == '/shooter/<sid>':
+        return f"/shooter/{rng.choice(targets['shooters'][comp_id])}"
+    if label == '/api/report/mcsi-leaderboard':
+        return f"{label}?year={rng.choice(targets['years'])}"
+    if label in ('/api/report/top-shooters', '/api/report/shot-distribution',
+                 '/api/report/field-strength'):
+        return f"{label}?discipline={urllib.parse.quote(rng.choice(targets['disciplines']))}"
+    return label
+
+
+def start_gunicorn(database_url, bind, workers, threads):
+    env = dict(os.environ, DATABASE_URL=database_url, FLASK_ENV='production')
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+               '--bind', bind, '--workers', str(workers), '--threads', str(threads),
+               '--access-logfile', '-' if os.getenv('LOADTEST_ACCESS_LOG') else '/dev/null',
+               'app:app']
+    print(f"Starting: {' '.join(command[1:])}")
+    return subprocess.Popen(command, cwd=ROOT, env=env, start_new_session=True)
+
+
+def wait_ready(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(base_url + '/', timeout=5) as response:
+                response.read()
+            return
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            time.sleep(0.5)
+    raise SystemExit("gunicorn did not become ready in time")
+
+
+class ConnectionMonitor(threading.Thread):
+    """Samples pg_stat_activity for this database once a second."""
+
+    def __init__(self, database_url, interval=1.0):
+        super().__init__(name='pg-monitor', daemon=True)
+        self.database_url = database_url
+        self.interval = interval
+        self.samples = []  # (seconds since start, {state: count})
+        self._done = threading.Event()
+
+    def run(self):
+        conn = psycopg2.connect(self.database_url)
+        conn.autocommit = True
+        cur = conn.cursor()
+        started = time.monotonic()
+        while not self._done.is_set():
+            cur.execute('''
+                SELECT COALESCE(state, 'unknown'), COUNT(*)
+                FROM pg_stat_activity
+                WHERE datname = current_database() AND pid <> pg_backend_pid()
+                GROUP BY 1;
+            ''')
+            self.samples.append((round(time.monotonic() - started, 1), dict(cur.fetchall())))
+            self._done.wait(self.interval)
+        conn.close()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def client(base_url, targets, deadline, results, lock, seed):
+    rng = random.Random(seed)
+    labels = [label for label, _ in ROUTE_MIX]
+    weights = [weight for _, weight in ROUTE_MIX]
+    local = []
+    while time.monotonic() < deadline:
+        label = rng.choices(labels, weights)[0]
+        path = pick_path(label, targets, rng)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base_url + path, timeout=30) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except Exception:
+            status = None
+        local.append((label, status, time.perf_counter() - started))
+    with lock:
+        results.extend(local)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(results, elapsed):
+    by_route = defaultdict(list)
+    for label, status, seconds in results:
+        by_route[label].append((status, seconds))
+    by_route['ALL'] = [(status, seconds) for _, status, seconds in results]
+
+    summary = {}
+    for label, rows in by_route.items():
+        latencies = sorted(seconds * 1000 for _, seconds in rows)
+        errors = sum(1 for status, _ in rows if status is None or status >= 500)
+        summary[label] = {
+            'requests': len(rows),
+            'rps': round(len(rows) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'error_rate': round(errors / len(rows), 4),
+        }
+    return summary
+
+
+def print_report(summary, samples):
+    print(f"\n{'route':<36} {'reqs':>7} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for label in [name for name, _ in ROUTE_MIX if name in summary] + ['ALL']:
+        s = summary[label]
+        print(f"{label:<36} {s['requests']:>7} {s['rps']:>7} {s['p50_ms']:>8} "
+              f"{s['p95_ms']:>8} {s['p99_ms']:>8} {s['error_rate'] * 100:>6.2f}%")
+
+    if samples:
+        totals = [sum(counts.values()) for _, counts in samples]
+        print(f"\nDB connections: min {min(totals)}, max {max(totals)}, "
+              f"avg {sum(totals) / len(totals):.1f}")
+        step = max(len(samples) // 20, 1)
+        for t, counts in samples[::step]:
+            detail = ', '.join(f"{state} {n}" for state, n in sorted(counts.items()))
+            print(f"  t={t:>6}s  {sum(counts.values()):>4}  ({detail})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the app under gunicorn.")
+    parser.add_argument('--database-url', default=os.getenv('LOADTEST_DATABASE_URL'))
+    parser.add_argument('--restore', help="pg_dump file to load into the database first")
+    parser.add_argument('--allow-remote', action='store_true')
+    parser.add_argument('--bind', default='127.0.0.1:8765')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--json', help="also write the summary to this file")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("--database-url (or LOADTEST_DATABASE_URL) is required")
+    host = urllib.parse.urlparse(args.database_url).hostname or ''
+    if host not in LOCAL_HOSTS and not args.allow_remote:
+        parser.error(f"refusing to load-test against non-local database host {host!r}")
+
+    if args.restore:
+        restore(args.database_url, args.restore)
+
+    sys.path.insert(0, ROOT)
+    os.environ['DATABASE_URL'] = args.database_url
+    from schema import ensure_schema
+    conn = psycopg2.connect(args.database_url)
+    ensure_schema(conn)
+    conn.close()
+
+    targets = load_targets(args.database_url)
+    latest = targets['competitions'][0]
+    print(f"{len(targets['competitions'])} competitions; live traffic on {latest[1]} {latest[2]}")
+
+    base_url = f"http://{args.bind}"
+    server = start_gunicorn(args.database_url, args.bind, args.workers, args.threads)
+    monitor = ConnectionMonitor(args.database_url)
+    try:
+        wait_ready(base_url, server)
+        monitor.start()
+
+        lock = threading.Lock()
+        if args.warmup:
+            print(f"Warming up for {args.warmup:.0f}s...")
+            warm = []
+            deadline = time.monotonic() + args.warmup
+            threads = [threading.Thread(target=client, args=(base_url, targets, deadline, warm, lock, -i))
+                       for i in range(args.concurrency)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        print(f"Running {args.concurrency} clients for {args.duration:.0f}s...")
+        results = []
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = [threading.Thread(target=client, args=(base_url, targets, deadline, results, lock, i))
+                   for i in range(args.concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - started
+    finally:
+        if monitor.is_alive():
+            monitor.stop()
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+
+    if not results:
+        raise SystemExit("No requests completed.")
+    summary = summarize(results, elapsed)
+    print_report(summary, monitor.samples)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'connections': monitor.samples}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from db import get_pooled_connection
+
+logger = logging.getLogger(__name__)
+
+# How long a worker trusts its last look at import_runs before checking again
+DATA_VERSION_TTL = float(os.getenv('DATA_VERSION_TTL', 30))
+
+_version_lock = threading.Lock()
+_version = {'value': None, 'checked_at': 0.0}
+
+
+def data_version():
+    """Return the latest import run id, re-read at most every DATA_VERSION_TTL seconds."""
+    now = time.monotonic()
+    if _version['value'] is not None and now - _version['checked_at'] < DATA_VERSION_TTL:
+        return _version['value']
+
+    with _version_lock:
+        if _version['value'] is None or now - _version['checked_at'] >= DATA_VERSION_TTL:
+            conn = get_pooled_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT COALESCE(MAX(run_id), 0) FROM import_runs;")
+                _version['value'] = cur.fetchone()[0]
+            finally:
+                conn.close()
+            _version['checked_at'] = now
+    return _version['value']
+
+
+class FragmentCache:
+    """Bounded LRU of rendered template output, sized by encoded bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+class ReportStore:
+    """Stale-while-revalidate store for expensive report results.
+
+    get() always returns the last good result immediately. When the data
+    version has moved on since that result was computed, a refresh is
+    queued on a thread pool and the next request sees the new value. Only
+    the very first request for a key computes inline.
+    """
+
+    def __init__(self, max_workers=2, max_entries=256, poll_interval=30):
+        self.max_workers = max_workers
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self._results = OrderedDict()  # key -> (version, value)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._pool = None
+        self._worker_pid = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def _executor(self):
+        # Threads do not survive fork, so each process builds its own pool
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='report-refresh')
+                    self._refreshing = set()
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _store(self, key, version, value):
+        with self._lock:
+            self._results[key] = (version, value)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def _run(self, key, compute, version):
+        try:
+            self._store(key, version, compute())
+            self.refreshes += 1
+        except Exception:
+            # Keep serving the last good value
+            self.failures += 1
+            logger.exception("Report refresh failed for %r", key)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def refresh(self, key, compute, version=None):
+        """Queue a background recompute of key unless one is already running."""
+        version = data_version() if version is None else version
+        executor = self._executor()
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        executor.submit(self._run, key, compute, version)
+
+    def get(self, key, compute):
+        version = data_version()
+        with self._lock:
+            entry = self._results.get(key)
+        if entry is None:
+            value = compute()
+            self._store(key, version, value)
+            return value
+        if entry[0] != version:
+            self.refresh(key, compute, version)
+        return entry[1]
+
+    def precompute(self, jobs):
+        """Queue every (key, compute) job that is missing or stale."""
+        version = data_version()
+        for key, compute in jobs:
+            with self._lock:
+                entry = self._results.get(key)
+            if entry is None or entry[0] != version:
+                self.refresh(key, compute, version)
+
+    def start(self, jobs_factory):
+        """Start a daemon thread that precomputes jobs_factory() whenever the data changes.
+
+        Safe to call on every request; it only starts once per process.
+        """
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+
+        def loop():
+            last_version = None
+            while True:
+                try:
+                    version = data_version()
+                    if version != last_version:
+                        self.precompute(jobs_factory())
+                        last_version = version
+                except Exception:
+                    logger.exception("Report precompute pass failed")
+                time.sleep(self.poll_interval)
+
+        threading.Thread(target=loop, name='report-precompute', daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._results),
+                'refreshing': len(self._refreshing),
+                'refreshes': self.refreshes,
+                'failures': self.failures,
+            }
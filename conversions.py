@@ -0,0 +1,159 @@
+"""60-point to 50-point score conversion in the database.
+
+target_conversions is the rules table: each (year, state_code, discipline)
+row marks a slice shot on 60-point targets, with state_code '*' matching
+every state. strings.on_60s records whether a string falls under a rule,
+and the generated columns strings.score_50 and strings.shots_50 hold the
+converted values, so any query can filter, sort or index on them.
+
+The SQL functions mirror scoring.convert_60_to_50. tests/test_conversions.py
+checks the two agree over a table of inputs; `check` compares the stored
+columns with the Python rules over every string.
+
+Usage:
+    python conversions.py backfill    # set on_60s for every string
+    python conversions.py check       # parity check against scoring.py
+"""
+import sys
+
+from db import get_connection
+
+ALL_STATES = '*'
+
+FUNCTION_STATEMENTS = [
+    """
+    CREATE OR REPLACE FUNCTION convert_shots_60_to_50(shots TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT replace(replace(shots, 'X', 'V'), '6', '5')
+    $$;
+    """,
+    # Each 6 drops a point; the centre count after the decimal point is kept
+    """
+    CREATE OR REPLACE FUNCTION convert_score_60_to_50(score NUMERIC, shots TEXT) RETURNS NUMERIC
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT round(trunc(score)
+                     - (length(COALESCE(shots, '')) - length(replace(COALESCE(shots, ''), '6', '')))
+                     + round((score - trunc(score)) * 10) / 10, 2)
+    $$;
+    """,
+]
+
+COLUMN_STATEMENTS = [
+    "ALTER TABLE strings ADD COLUMN IF NOT EXISTS on_60s BOOLEAN NOT NULL DEFAULT FALSE;",
+    """ALTER TABLE strings ADD COLUMN IF NOT EXISTS score_50 NUMERIC(7, 2)
+       GENERATED ALWAYS AS (CASE WHEN on_60s THEN convert_score_60_to_50(score::numeric, shots_raw)
+                                 ELSE score::numeric END) STORED;""",
+    """ALTER TABLE strings ADD COLUMN IF NOT EXISTS shots_50 TEXT
+       GENERATED ALWAYS AS (CASE WHEN on_60s THEN convert_shots_60_to_50(shots_raw)
+                                 ELSE shots_raw END) STORED;""",
+    """CREATE INDEX IF NOT EXISTS strings_discipline_score_50_idx
+       ON strings (norm_discipline, score_50 DESC NULLS LAST);""",
+]
+
+
+def update_on_60s(cur, year=None, state_code=None, discipline=None):
+    """Re-evaluate strings.on_60s against target_conversions for one slice.
+
+    Any of the filters may be None to widen the slice. Returns the number
+    of strings whose flag changed.
+    """
+    from scoring import original_disciplines
+
+    filters = ['st.competition_id = c.competition_id']
+    params = []
+    if year is not None:
+        filters.append('c.year = %s')
+        params.append(year)
+    if state_code not in (None, ALL_STATES):
+        filters.append('s.code = %s')
+        params.append(state_code)
+    if discipline is not None:
+        filters.append('st.discipline = ANY(%s)')
+        params.append(original_disciplines(discipline))
+
+    # on_60s is NOT NULL, so every row that disagrees with the rules flips
+    cur.execute(f'''
+        UPDATE strings st
+        SET on_60s = NOT st.on_60s
+        FROM competitions c
+        JOIN states s ON c.state_id = s.state_id
+        WHERE {' AND '.join(filters)}
+          AND st.on_60s <> EXISTS (
+              SELECT 1 FROM target_conversions tc
+              WHERE tc.year = c.year
+                AND tc.state_code IN (s.code, '{ALL_STATES}')
+                AND tc.discipline = st.norm_discipline
+          );
+    ''', params)
+    return cur.rowcount
+
+
+def backfill(conn):
+    from field_ranks import fill_norm_discipline
+
+    cur = conn.cursor()
+    cur.execute("SELECT competition_id FROM competitions;")
+    fill_norm_discipline(cur, [row[0] for row in cur.fetchall()])
+    changed = update_on_60s(cur)
+    conn.commit()
+    print(f"Updated on_60s for {changed} strings.")
+
+
+def check_parity(conn):
+    """Compare on_60s, score_50 and shots_50 with the Python rules for every string."""
+    from mcsi_params import get_table
+    from scoring import convert_60_to_50, normalize_discipline
+
+    table = get_table()
+    cur = conn.cursor(name='conversion_parity')
+    cur.itersize = 5000
+    cur.execute('''
+        SELECT st.string_id, c.year, s.code, st.discipline, st.score, st.shots_raw,
+               st.on_60s, st.score_50, st.shots_50
+        FROM strings st
+        JOIN competitions c ON st.competition_id = c.competition_id
+        JOIN states s ON c.state_id = s.state_id;
+    ''')
+
+    checked = 0
+    mismatches = []
+    for string_id, year, code, disc, score, shots_raw, on_60s, score_50, shots_50 in cur:
+        checked += 1
+        expected_60s = table.is_60_point(year, code, normalize_discipline(disc))
+        if expected_60s:
+            expected_score, expected_shots = convert_60_to_50(
+                float(score) if score is not None else None, shots_raw)
+        else:
+            expected_score, expected_shots = score, shots_raw
+
+        if (on_60s != expected_60s
+                or shots_50 != expected_shots
+                or (score_50 is None) != (expected_score is None)
+                or (score_50 is not None and abs(float(score_50) - float(expected_score)) > 0.005)):
+            mismatches.append((string_id, on_60s, score_50, shots_50,
+                               expected_60s, expected_score, expected_shots))
+    cur.close()
+
+    print(f"Checked {checked} strings, {len(mismatches)} mismatches.")
+    for m in mismatches[:20]:
+        print(f"  string {m[0]}: db=({m[1]}, {m[2]}, {m[3]}) python=({m[4]}, {m[5]}, {m[6]})")
+    return not mismatches
+
+
+if __name__ == "__main__":
+    from schema import ensure_schema
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command not in ('backfill', 'check'):
+        print(__doc__)
+        sys.exit(1)
+
+    conn = get_connection()
+    ensure_schema(conn)
+    if command == 'backfill':
+        backfill(conn)
+        conn.close()
+    else:
+        ok = check_parity(conn)
+        conn.close()
+        sys.exit(0 if ok else 1)
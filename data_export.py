@@ -0,0 +1,245 @@
+"""Stream results and shots to Parquet or Arrow IPC files.
+
+Rows are read through server-side cursors in fixed-size chunks and written
+one record batch at a time, so memory stays bounded by the chunk size.
+Output is partitioned by competition year and state:
+
+    OUT_DIR/<table>/year=<year>/state=<code>/part.<parquet|arrow>
+
+Usage:
+    python data_export.py OUT_DIR [--format parquet|arrow] [--incremental]
+"""
+import argparse
+import json
+import os
+
+from db import get_connection
+from schema import get_changes_since
+
+CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 50000))
+STATE_FILE = '_export_state.json'
+FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+# table -> (query for one competition, [(column, arrow type), ...])
+TABLES = {
+    'aggregates': ('''
+        SELECT aggregate_id, competition_id, match_number, match_name, discipline,
+               norm_discipline, place, shooter_sid, state, info, score::float8,
+               field_size, percentile::float8
+        FROM aggregates
+        WHERE competition_id = %s;
+    ''', [
+        ('aggregate_id', 'int64'), ('competition_id', 'int32'), ('match_number', 'int32'),
+        ('match_name', 'string'), ('discipline', 'string'), ('norm_discipline', 'string'),
+        ('place', 'int32'), ('shooter_sid', 'int32'), ('shooter_state', 'string'),
+        ('info', 'string'), ('score', 'float64'), ('field_size', 'int32'),
+        ('percentile', 'float64'),
+    ]),
+    'strings': ('''
+        SELECT string_id, competition_id, match_number, match_name, distance, distance_unit,
+               discipline, norm_discipline, place, shooter_sid, state, shots_raw, info,
+               score::float8, mcsi::float8, field_size, percentile::float8
+        FROM strings
+        WHERE competition_id = %s;
+    ''', [
+        ('string_id', 'int64'), ('competition_id', 'int32'), ('match_number', 'int32'),
+        ('match_name', 'string'), ('distance', 'int32'), ('distance_unit', 'string'),
+        ('discipline', 'string'), ('norm_discipline', 'string'), ('place', 'int32'),
+        ('shooter_sid', 'int32'), ('shooter_state', 'string'), ('shots_raw', 'string'),
+        ('info', 'string'), ('score', 'float64'), ('mcsi', 'float64'),
+        ('field_size', 'int32'), ('percentile', 'float64'),
+    ]),
+    'shots': ('''
+        SELECT sh.string_id, st.competition_id, sh.shot_number, sh.shot_value
+        FROM shots sh
+        JOIN strings st ON sh.string_id = st.string_id
+        WHERE st.competition_id = %s;
+    ''', [
+        ('string_id', 'int64'), ('competition_id', 'int32'), ('shot_number', 'int32'),
+        ('shot_value', 'string'),
+    ]),
+}
+
+
+def get_pyarrow():
+    """Import and return pyarrow, or raise RuntimeError if it is not installed."""
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Exporting requires pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def arrow_schema(pa, table):
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in TABLES[table][1]])
+
+
+def iter_chunks(conn, table, competition_id, chunk_size=CHUNK_SIZE):
+    """Yield lists of rows for one competition via a server-side cursor."""
+    cur = conn.cursor(name=f'export_{table}_{competition_id}')
+    cur.itersize = chunk_size
+    try:
+        cur.execute(TABLES[table][0], (competition_id,))
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def to_batch(pa, schema, rows):
+    columns = list(zip(*rows))
+    return pa.record_batch(
+        [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+class _ChunkSink:
+    """Write-only file object whose contents are drained after each batch."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _open_writer(pa, sink, schema, fmt, streaming=False):
+    if fmt == 'parquet':
+        return pa.parquet.ParquetWriter(sink, schema)
+    if streaming:
+        return pa.ipc.new_stream(sink, schema)
+    return pa.ipc.new_file(sink, schema)
+
+
+def _write(writer, pa, batch, fmt):
+    if fmt == 'parquet':
+        writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        writer.write_batch(batch)
+
+
+def stream_table(conn, table, competition_ids, fmt='arrow'):
+    """Yield the encoded bytes of one table over the given competitions."""
+    pa = get_pyarrow()
+    schema = arrow_schema(pa, table)
+    sink = _ChunkSink()
+    writer = _open_writer(pa, sink, schema, fmt, streaming=True)
+    for competition_id in competition_ids:
+        for rows in iter_chunks(conn, table, competition_id):
+            _write(writer, pa, to_batch(pa, schema, rows), fmt)
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def partition_path(out_dir, table, year, state_code, fmt):
+    return os.path.join(out_dir, table, f'year={year}', f'state={state_code}', f'part.{FORMATS[fmt]}')
+
+
+def write_partition(conn, out_dir, table, competition_id, year, state_code, fmt):
+    """Write one (table, year, state) partition. Returns the row count."""
+    pa = get_pyarrow()
+    schema = arrow_schema(pa, table)
+    path = partition_path(out_dir, table, year, state_code, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+
+    writer = None
+    count = 0
+    for rows in iter_chunks(conn, table, competition_id):
+        if writer is None:
+            writer = _open_writer(pa, tmp_path, schema, fmt)
+        _write(writer, pa, to_batch(pa, schema, rows), fmt)
+        count += len(rows)
+
+    if writer is None:
+        # Nothing left for this partition; drop any stale file
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+
+    writer.close()
+    os.replace(tmp_path, path)
+    return count
+
+
+def export(out_dir, fmt='parquet', incremental=False):
+    """Export every table, or only competitions changed since the last export."""
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, STATE_FILE)
+    previous = None
+    if incremental and os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('format') != fmt:
+            previous = None
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    if previous is None:
+        last_run_id, _, _ = get_changes_since(cur, 0)
+        cur.execute('SELECT competition_id FROM competitions;')
+        competition_ids = [row[0] for row in cur.fetchall()]
+    else:
+        last_run_id, changed, _ = get_changes_since(cur, previous['run_id'])
+        competition_ids = sorted(changed)
+
+    cur.execute('''
+        SELECT c.competition_id, c.year, s.code
+        FROM competitions c
+        JOIN states s ON c.state_id = s.state_id
+        WHERE c.competition_id = ANY(%s)
+        ORDER BY c.year, s.code;
+    ''', (competition_ids,))
+    competitions = cur.fetchall()
+    conn.commit()
+
+    print(f"Exporting {len(competitions)} competitions as {fmt}...")
+    for comp_id, year, code in competitions:
+        counts = {
+            table: write_partition(conn, out_dir, table, comp_id, year, code, fmt)
+            for table in TABLES
+        }
+        conn.commit()
+        print(f"  {code} {year}: " + ', '.join(f"{n} {t}" for t, n in counts.items()))
+
+    conn.close()
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump({'run_id': last_run_id, 'format': fmt}, f, indent=2)
+    return len(competitions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export results and shots to Parquet/Arrow.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='parquet')
+    parser.add_argument('--incremental', action='store_true',
+                        help="only re-export competitions changed since the last export")
+    args = parser.parse_args()
+    export(args.out_dir, fmt=args.format, incremental=args.incremental)
@@ -0,0 +1,117 @@
+"""Kings/Queens classification and event MCSI snapshots.
+
+A string counts toward an event's Kings/Queens MCSI rankings when its
+match name matches a row in kings_queens_rules for the competition's state
+(or '*') and year range. Classification and the snapshot tables are
+recomputed per competition with set-based SQL, inside the importer's chunk
+transaction and again after MCSI parameters change, so the event page
+reads ranked rows instead of aggregating strings on every view.
+
+event_mcsi_strings ranks every qualifying string by MCSI; event_mcsi_shooters
+holds each shooter's total, average, string count and disciplines. Both
+are keyed by (competition_id, rank).
+
+Usage:
+    python event_mcsi.py    # reclassify and rebuild every competition (after editing rules)
+"""
+from db import get_connection
+
+# Default rules; edit kings_queens_rules and rerun this module to change them
+DEFAULT_RULES = [
+    ('*', '%King%'),
+    ('*', '%Queen%'),
+]
+
+
+def seed_statements():
+    values = ', '.join(f"('{state}', '{pattern}')" for state, pattern in DEFAULT_RULES)
+    return [
+        f"INSERT INTO kings_queens_rules (state_code, match_pattern) VALUES {values} "
+        f"ON CONFLICT DO NOTHING;",
+    ]
+
+
+def classify(cur, competition_ids):
+    """Set strings.is_kings_queens from the rules, writing only rows that change."""
+    cur.execute('''
+        UPDATE strings st SET is_kings_queens = k.matched
+        FROM (
+            SELECT st2.string_id, EXISTS (
+                SELECT 1 FROM kings_queens_rules r
+                WHERE r.state_code IN ('*', s.code)
+                  AND (r.from_year IS NULL OR c.year >= r.from_year)
+                  AND (r.to_year IS NULL OR c.year <= r.to_year)
+                  AND st2.match_name LIKE r.match_pattern
+            ) AS matched
+            FROM strings st2
+            JOIN competitions c ON st2.competition_id = c.competition_id
+            JOIN states s ON c.state_id = s.state_id
+            WHERE st2.competition_id = ANY(%s)
+        ) k
+        WHERE st.string_id = k.string_id
+          AND st.is_kings_queens IS DISTINCT FROM k.matched;
+    ''', (list(competition_ids),))
+
+
+def refresh_snapshots(cur, competition_ids):
+    """Rewrite the ranked string and shooter snapshots for the given competitions."""
+    competition_ids = list(competition_ids)
+    cur.execute("DELETE FROM event_mcsi_strings WHERE competition_id = ANY(%s);", (competition_ids,))
+    cur.execute("DELETE FROM event_mcsi_shooters WHERE competition_id = ANY(%s);", (competition_ids,))
+
+    cur.execute('''
+        INSERT INTO event_mcsi_strings
+            (competition_id, rank, string_id, sid, discipline, distance,
+             score, score_50, converted, mcsi, match_name)
+        SELECT st.competition_id,
+               ROW_NUMBER() OVER (PARTITION BY st.competition_id
+                                  ORDER BY st.mcsi DESC, sh.last_name, sh.first_name, st.string_id),
+               st.string_id, st.shooter_sid, COALESCE(st.norm_discipline, st.discipline),
+               CASE WHEN st.distance > 0 THEN st.distance || COALESCE(st.distance_unit, '') ELSE '' END,
+               st.score, st.score_50, COALESCE(st.on_60s, FALSE), st.mcsi, st.match_name
+        FROM strings st
+        JOIN shooters sh ON st.shooter_sid = sh.sid
+        WHERE st.competition_id = ANY(%s) AND st.is_kings_queens
+          AND st.score IS NOT NULL AND st.mcsi <> 0;
+    ''', (competition_ids,))
+
+    cur.execute('''
+        INSERT INTO event_mcsi_shooters
+            (competition_id, rank, sid, total_mcsi, avg_mcsi, shoots, disciplines)
+        SELECT competition_id,
+               ROW_NUMBER() OVER (PARTITION BY competition_id
+                                  ORDER BY SUM(mcsi) DESC, MAX(mcsi) DESC, sid),
+               sid, ROUND(SUM(mcsi), 2), ROUND(AVG(mcsi), 2), COUNT(*),
+               array_agg(DISTINCT discipline ORDER BY discipline)
+        FROM event_mcsi_strings
+        WHERE competition_id = ANY(%s)
+        GROUP BY competition_id, sid;
+    ''', (competition_ids,))
+
+
+def refresh(cur, competition_ids):
+    if not competition_ids:
+        return
+    classify(cur, competition_ids)
+    refresh_snapshots(cur, competition_ids)
+
+
+def rebuild(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT competition_id FROM competitions;")
+    competition_ids = [row[0] for row in cur.fetchall()]
+    refresh(cur, competition_ids)
+    conn.commit()
+    return competition_ids
+
+
+if __name__ == "__main__":
+    from schema import ensure_schema, record_run
+
+    conn = get_connection()
+    ensure_schema(conn)
+    competition_ids = rebuild(conn)
+    # Bump the data version so cached event pages refresh
+    record_run(conn, 'event_mcsi', competition_ids, set())
+    conn.close()
+    print(f"Rebuilt event MCSI snapshots for {len(competition_ids)} competitions.")
@@ -0,0 +1,69 @@
+"""Field size and percentile rank for aggregates and strings.
+
+Each result is ranked within its field (competition, match, normalized
+discipline) by place, then score. Percentile 100 is the winner and 0 the
+last place.
+
+Usage:
+    python field_ranks.py    # backfill every competition
+"""
+from db import get_connection
+from scoring import DISCIPLINE_MAP
+
+RANKED_TABLES = [
+    ('aggregates', 'aggregate_id'),
+    ('strings', 'string_id'),
+]
+
+
+def fill_norm_discipline(cur, competition_ids):
+    """Set norm_discipline where it is missing for the given competitions."""
+    mapping = ', '.join(cur.mogrify('(%s, %s)', pair).decode() for pair in DISCIPLINE_MAP.items())
+    for table, _ in RANKED_TABLES:
+        cur.execute(f'''
+            UPDATE {table} t
+            SET norm_discipline = COALESCE(
+                (SELECT m.normalized FROM (VALUES {mapping}) AS m(discipline, normalized)
+                 WHERE m.discipline = t.discipline),
+                t.discipline)
+            WHERE t.competition_id = ANY(%s)
+              AND t.norm_discipline IS NULL;
+        ''', (list(competition_ids),))
+
+
+def update_field_ranks(cur, competition_ids):
+    """Recompute field_size and percentile for the given competitions."""
+    competition_ids = list(competition_ids)
+    fill_norm_discipline(cur, competition_ids)
+    for table, key in RANKED_TABLES:
+        cur.execute(f'''
+            UPDATE {table} t
+            SET field_size = r.field_size, percentile = r.percentile
+            FROM (
+                SELECT {key},
+                       COUNT(*) OVER w AS field_size,
+                       ROUND((100 * (1 - PERCENT_RANK() OVER (w ORDER BY place NULLS LAST,
+                                                                score DESC NULLS LAST)))::numeric, 2)
+                           AS percentile
+                FROM {table}
+                WHERE competition_id = ANY(%s)
+                WINDOW w AS (PARTITION BY competition_id, match_name, norm_discipline)
+            ) r
+            WHERE t.{key} = r.{key}
+              AND (t.field_size IS DISTINCT FROM r.field_size
+                   OR t.percentile IS DISTINCT FROM r.percentile);
+        ''', (competition_ids,))
+
+
+if __name__ == "__main__":
+    from schema import ensure_schema
+
+    conn = get_connection()
+    ensure_schema(conn)
+    cur = conn.cursor()
+    cur.execute("SELECT competition_id FROM competitions ORDER BY competition_id;")
+    for (comp_id,) in cur.fetchall():
+        update_field_ranks(cur, [comp_id])
+        conn.commit()
+        print(f"Ranked competition {comp_id}")
+    conn.close()
@@ -0,0 +1,18 @@
+import gc
+
+# Import (and warm up) the app once in the master; workers share the
+# compiled templates and reference data copy-on-write.
+preload_app = True
+
+
+def when_ready(server):
+    # Connections opened during warm-up must not be inherited by workers
+    from db import close_pool
+    close_pool()
+    # Keep the GC from touching (and so copying) the shared objects in workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import warm_worker
+    warm_worker()
@@ -0,0 +1,174 @@
+"""Shooter results index and head-to-head comparison.
+
+shooter_results holds one compact row per aggregate or string result,
+keyed and indexed by shooter and then (competition, match, discipline,
+distance). Strings of one match shot at several distances stay separate.
+Reading it for a handful of SIDs is an index-only scan giving one list per
+shooter, sorted in Python by the same key the merge compares on, and
+comparing shooters is a merge of those lists rather than a self-join over
+aggregates and strings.
+
+Usage:
+    python head_to_head.py    # rebuild the index from aggregates and strings
+"""
+import heapq
+from itertools import combinations, groupby
+
+from db import get_connection
+
+_INDEX_AGGREGATES = '''
+    INSERT INTO shooter_results
+        (sid, competition_id, match_number, match_name, norm_discipline, distance, is_aggregate,
+         result_id, place, score, mcsi)
+    SELECT shooter_sid, competition_id, match_number, match_name,
+           COALESCE(norm_discipline, discipline), '', TRUE, aggregate_id, place, score, NULL
+    FROM aggregates
+    {where}
+    ON CONFLICT (is_aggregate, result_id) DO NOTHING;
+'''
+
+_INDEX_STRINGS = '''
+    INSERT INTO shooter_results
+        (sid, competition_id, match_number, match_name, norm_discipline, distance, is_aggregate,
+         result_id, place, score, mcsi)
+    SELECT shooter_sid, competition_id, match_number, match_name,
+           COALESCE(norm_discipline, discipline),
+           CASE WHEN distance > 0 THEN distance || COALESCE(distance_unit, '') ELSE '' END,
+           FALSE, string_id, place, score, mcsi
+    FROM strings
+    {where}
+    ON CONFLICT (is_aggregate, result_id) DO NOTHING;
+'''
+
+
+def index_results(cur, aggregate_ids, string_ids):
+    """Add newly inserted aggregates and strings to the index."""
+    if aggregate_ids:
+        cur.execute(_INDEX_AGGREGATES.format(where='WHERE aggregate_id = ANY(%s)'),
+                    (list(aggregate_ids),))
+    if string_ids:
+        cur.execute(_INDEX_STRINGS.format(where='WHERE string_id = ANY(%s)'),
+                    (list(string_ids),))
+
+
+def rebuild(conn):
+    cur = conn.cursor()
+    cur.execute("DELETE FROM shooter_results;")
+    cur.execute(_INDEX_AGGREGATES.format(where=''))
+    cur.execute(_INDEX_STRINGS.format(where=''))
+    cur.execute("SELECT COUNT(*) FROM shooter_results;")
+    count = cur.fetchone()[0]
+    conn.commit()
+    return count
+
+
+def load_results(cur, sids):
+    """{sid: [(key, place, score, mcsi), ...]} sorted by key, from the index only.
+
+    The lists are sorted here rather than by ORDER BY: Postgres puts NULL
+    match numbers last and compares names by collation, and the merge in
+    shared_results needs exactly the order Python compares keys in.
+    """
+    cur.execute('''
+        SELECT sid, competition_id, match_number, match_name, norm_discipline, distance,
+               is_aggregate, place, score, mcsi
+        FROM shooter_results
+        WHERE sid = ANY(%s);
+    ''', (list(sids),))
+    results = {sid: [] for sid in sids}
+    for (sid, comp_id, match_number, match_name, disc, distance, is_aggregate,
+         place, score, mcsi) in cur.fetchall():
+        key = (comp_id, match_number or 0, match_name or '', disc or '', distance, is_aggregate)
+        results[sid].append((key, place,
+                             float(score) if score is not None else None,
+                             float(mcsi) if mcsi is not None else None))
+    for entries in results.values():
+        entries.sort(key=lambda entry: entry[0])
+    return results
+
+
+def shared_results(results):
+    """Merge the per-shooter lists, yielding (key, {sid: (place, score, mcsi)}) shot by 2+ shooters."""
+    streams = [[(entry[0], sid, entry[1:]) for entry in entries] for sid, entries in results.items()]
+    merged = heapq.merge(*streams, key=lambda item: item[0])
+    for key, group in groupby(merged, key=lambda item: item[0]):
+        by_sid = {}
+        for _, sid, values in group:
+            by_sid.setdefault(sid, values)
+        if len(by_sid) > 1:
+            yield key, by_sid
+
+
+def _beats(a, b):
+    """1 if result a beat b, -1 if it lost, 0 for a tie or no basis to compare."""
+    (place_a, score_a, _), (place_b, score_b, _) = a, b
+    if place_a is not None and place_b is not None and place_a != place_b:
+        return 1 if place_a < place_b else -1
+    if score_a is not None and score_b is not None and score_a != score_b:
+        return 1 if score_a > score_b else -1
+    return 0
+
+
+def compare(results):
+    """Shared matches plus pairwise records per discipline.
+
+    Wins, losses and score deltas come from aggregates; MCSI deltas from
+    strings, which is where MCSI is stored.
+    """
+    matches = []
+    pairs = {}
+    for key, by_sid in shared_results(results):
+        comp_id, match_number, match_name, disc, distance, is_aggregate = key
+        matches.append({
+            'competition_id': comp_id,
+            'match_number': match_number,
+            'match_name': match_name,
+            'discipline': disc,
+            'distance': distance,
+            'aggregate': is_aggregate,
+            'results': {sid: {'place': v[0], 'score': v[1], 'mcsi': v[2]} for sid, v in by_sid.items()},
+        })
+
+        for a, b in combinations(sorted(by_sid), 2):
+            record = pairs.setdefault((a, b), {}).setdefault(disc, {
+                'shared': 0, 'wins': 0, 'losses': 0, 'ties': 0,
+                'score_delta': 0.0, 'scored': 0, 'mcsi_delta': 0.0, 'mcsi_shared': 0,
+            })
+            ra, rb = by_sid[a], by_sid[b]
+            if is_aggregate:
+                record['shared'] += 1
+                outcome = _beats(ra, rb)
+                record['wins' if outcome > 0 else 'losses' if outcome < 0 else 'ties'] += 1
+                if ra[1] is not None and rb[1] is not None:
+                    record['score_delta'] += ra[1] - rb[1]
+                    record['scored'] += 1
+            elif ra[2] is not None and rb[2] is not None:
+                record['mcsi_delta'] += ra[2] - rb[2]
+                record['mcsi_shared'] += 1
+
+    pair_list = []
+    for (a, b), disciplines in pairs.items():
+        summary = {}
+        for disc, r in disciplines.items():
+            summary[disc] = {
+                'shared_aggregates': r['shared'],
+                'wins': r['wins'],
+                'losses': r['losses'],
+                'ties': r['ties'],
+                'avg_score_delta': round(r['score_delta'] / r['scored'], 2) if r['scored'] else None,
+                'shared_strings': r['mcsi_shared'],
+                'avg_mcsi_delta': round(r['mcsi_delta'] / r['mcsi_shared'], 2) if r['mcsi_shared'] else None,
+            }
+        pair_list.append({'sids': [a, b], 'disciplines': summary})
+
+    return matches, sorted(pair_list, key=lambda p: p['sids'])
+
+
+if __name__ == "__main__":
+    from schema import ensure_schema
+
+    conn = get_connection()
+    ensure_schema(conn)
+    count = rebuild(conn)
+    conn.close()
+    print(f"Indexed {count} shooter results.")
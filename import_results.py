@@ -1,10 +1,25 @@
 import csv
+import hashlib
+import os
 import sys
 from db import get_connection
 from psycopg2.extras import execute_values
+from schema import ensure_schema, record_run
+from scoring import calculate_mcsi, needs_60_to_50_conversion, normalize_discipline
+from field_ranks import update_field_ranks
+from ratings import update_ratings
+from shot_sequence import add_strings as add_shot_sequence
+from summaries import refresh as refresh_summaries
+from event_mcsi import refresh as refresh_event_mcsi
+from head_to_head import index_results
+from import_stats import print_run_diff, table_totals
 
-# Pass CSV path as argument or use default
-CSV_PATH = sys.argv[1] if len(sys.argv) > 1 else "/Users/dancomerford/Desktop/results/nraa_results-2025.csv"
+# Pass CSV path as argument or use default; --restart ignores any checkpoint
+_args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+CSV_PATH = _args[0] if _args else "/Users/dancomerford/Desktop/results/nraa_results-2025.csv"
+
+# Rows per atomically committed chunk
+CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', 5000))
 
 
 def get_or_create_competition(cur, state_code, year):
@@ -111,132 +126,236 @@ def parse_shots(shots_raw):
     return [(i + 1, shot.upper()) for i, shot in enumerate(shots_raw)]
 
 
-def import_data(conn):
-    """Import results data from CSV."""
-    cur = conn.cursor()
+def file_hash(path):
+    """SHA-256 of a file's contents, used to identify it across runs."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
-    print(f"Importing from: {CSV_PATH}")
 
-    # Build shooter lookup
-    print("Building shooter lookup...")
-    lookup, name_only_lookup = build_shooter_lookup(conn)
-    print(f"Lookup has {len(lookup)} entries (with club), {len(name_only_lookup)} entries (name only)")
+class OffsetLines:
+    """Iterate the decoded lines of a binary file, tracking bytes consumed."""
 
-    # Read CSV and organize data
-    print("Reading CSV...")
-    comp_map = {}  # competition name -> competition_id
-    aggregates = []
-    strings = []
-    unmatched = []
-
-    with open(CSV_PATH, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            comp_name = row['competition']
-
-            # Get or create competition
-            if comp_name not in comp_map:
-                state_code, year = parse_competition_name(comp_name)
-                comp_id = get_or_create_competition(cur, state_code, year)
-                comp_map[comp_name] = comp_id
-                conn.commit()
-
-            is_aggregate = 'Aggregate' in row['match_name']
-
-            shooter_sid = match_shooter(
-                row['first_name'],
-                row['last_name'],
-                row['club'],
-                lookup,
-                name_only_lookup
-            )
-
-            if shooter_sid is None:
-                unmatched.append({**row, 'is_aggregate': is_aggregate})
-            elif is_aggregate:
-                aggregates.append({**row, 'sid': shooter_sid})
-            else:
-                strings.append({**row, 'sid': shooter_sid})
-
-    print(f"Found {len(comp_map)} competitions")
-    print(f"Aggregates: {len(aggregates)}, Strings: {len(strings)}, Unmatched: {len(unmatched)}")
-
-    # Insert aggregates
-    print("Inserting aggregates...")
-    agg_data = [
-        (
-            comp_map[row['competition']],
-            int(row['match_number']) if row['match_number'] else None,
-            row['match_name'],
-            row['discipline'],
-            int(row['place']) if row['place'] else None,
-            row['sid'],
-            row['state'],
-            row['info'],
-            float(row['score']) if row['score'] else None
-        )
-        for row in aggregates
-    ]
+    def __init__(self, f):
+        self.f = f
+        self.offset = f.tell()
 
-    if agg_data:
-        execute_values(
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode('utf-8')
+
+
+class ResultRow:
+    """One parsed CSV row, with values converted once."""
+    __slots__ = ('competition', 'match_number', 'match_name', 'distance', 'distance_unit',
+                 'discipline', 'place', 'full_name', 'last_name', 'first_name', 'club',
+                 'state', 'shots', 'info', 'score')
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+
+class Batch:
+    """Insert-ready tuples for one chunk, plus where the chunk ends in the file."""
+    __slots__ = ('aggregates', 'strings', 'unmatched', 'competition_ids', 'shooter_sids', 'end_offset')
+
+    def __init__(self):
+        self.aggregates = []
+        self.strings = []
+        self.unmatched = []
+        self.competition_ids = set()
+        self.shooter_sids = set()
+        self.end_offset = 0
+
+    def __len__(self):
+        return len(self.aggregates) + len(self.strings) + len(self.unmatched)
+
+
+def read_records(path, start_offset=0):
+    """Stage 1: yield (header index, field list, end_offset) from a byte offset.
+
+    end_offset is where the next record starts, so it can be stored as a
+    checkpoint and passed back in to resume.
+    """
+    with open(path, 'rb') as f:
+        lines = OffsetLines(f)
+        header = next(csv.reader(lines))
+        index = {name: i for i, name in enumerate(header)}
+        if start_offset > lines.offset:
+            f.seek(start_offset)
+            lines.offset = start_offset
+
+        # csv pulls whole records from lines, so offset is always at a record boundary
+        for fields in csv.reader(lines):
+            yield index, fields, lines.offset
+
+
+CSV_COLUMNS = ('competition', 'match_number', 'match_name', 'distance', 'distance_unit',
+               'discipline', 'place', 'full_name', 'last_name', 'first_name', 'club',
+               'state', 'shots', 'info', 'score')
+
+
+def _int_or_none(value):
+    return int(value) if value else None
+
+
+def _float_or_none(value):
+    return float(value) if value else None
+
+
+def parse_records(records):
+    """Stage 2: yield (ResultRow, end_offset) with numeric fields converted."""
+    positions = None
+    for index, fields, end_offset in records:
+        if positions is None:
+            positions = [index[name] for name in CSV_COLUMNS]
+            width = max(positions) + 1
+        if not fields:
+            continue  # blank line
+        if len(fields) < width:
+            raise ValueError(f"Short CSV record ending at byte {end_offset}: "
+                             f"{len(fields)} fields, expected at least {width}")
+        (competition, match_number, match_name, distance, distance_unit, discipline, place,
+         full_name, last_name, first_name, club, state, shots, info, score) = \
+            [fields[i] for i in positions]
+
+        yield ResultRow(
+            competition, _int_or_none(match_number), match_name, _int_or_none(distance),
+            distance_unit, discipline, _int_or_none(place), full_name, last_name, first_name,
+            club, state, shots, info, _float_or_none(score)
+        ), end_offset
+
+
+def match_rows(rows, lookup, name_only_lookup):
+    """Stage 3: yield (row, sid or None, end_offset)."""
+    for row, end_offset in rows:
+        sid = match_shooter(row.first_name, row.last_name, row.club, lookup, name_only_lookup)
+        yield row, sid, end_offset
+
+
+def route_rows(matched, resolve_competition, chunk_rows=CHUNK_ROWS):
+    """Stage 4: route rows into insert tuples, yielding a Batch every chunk_rows rows.
+
+    resolve_competition(name) returns (competition_id, state_code, year).
+    """
+    batch = Batch()
+    for row, sid, end_offset in matched:
+        comp_id, state_code, year = resolve_competition(row.competition)
+        is_aggregate = 'Aggregate' in row.match_name
+
+        if sid is None:
+            batch.unmatched.append((
+                row.competition, row.match_number, row.match_name, row.distance,
+                row.distance_unit, row.discipline, row.place, row.full_name, row.last_name,
+                row.first_name, row.club, row.state, row.shots, row.info, row.score,
+                is_aggregate
+            ))
+        elif is_aggregate:
+            batch.aggregates.append((
+                comp_id, row.match_number, row.match_name, row.discipline,
+                normalize_discipline(row.discipline), row.place, sid, row.state, row.info,
+                row.score
+            ))
+        else:
+            batch.strings.append((
+                comp_id, row.match_number, row.match_name, row.distance, row.distance_unit,
+                row.discipline, normalize_discipline(row.discipline), row.place, sid,
+                row.state, row.shots, row.info, row.score,
+                calculate_mcsi(row.score, row.discipline, state_code, year, row.shots),
+                needs_60_to_50_conversion(state_code, year, row.discipline)
+            ))
+
+        batch.competition_ids.add(comp_id)
+        if sid is not None:
+            batch.shooter_sids.add(sid)
+        batch.end_offset = end_offset
+
+        if len(batch) >= chunk_rows:
+            yield batch
+            batch = Batch()
+
+    if len(batch):
+        yield batch
+
+
+def pipeline(path, start_offset, resolve_competition, lookup, name_only_lookup,
+             chunk_rows=CHUNK_ROWS):
+    """read -> parse -> match -> route, yielding bounded Batches."""
+    records = read_records(path, start_offset)
+    rows = parse_records(records)
+    matched = match_rows(rows, lookup, name_only_lookup)
+    return route_rows(matched, resolve_competition, chunk_rows)
+
+
+def load_checkpoint(cur, digest):
+    cur.execute("""
+        SELECT byte_offset, chunk_number, competition_ids, shooter_sids, completed
+        FROM import_checkpoints WHERE file_hash = %s;
+    """, (digest,))
+    return cur.fetchone()
+
+
+def save_checkpoint(cur, digest, byte_offset, chunk_number, competition_ids, shooter_sids):
+    """Advance the checkpoint; runs inside the chunk's transaction."""
+    cur.execute("""
+        INSERT INTO import_checkpoints
+            (file_hash, source, byte_offset, chunk_number, competition_ids, shooter_sids)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (file_hash) DO UPDATE
+        SET byte_offset = EXCLUDED.byte_offset,
+            chunk_number = EXCLUDED.chunk_number,
+            competition_ids = ARRAY(SELECT DISTINCT unnest(
+                import_checkpoints.competition_ids || EXCLUDED.competition_ids)),
+            shooter_sids = ARRAY(SELECT DISTINCT unnest(
+                import_checkpoints.shooter_sids || EXCLUDED.shooter_sids)),
+            updated_at = now();
+    """, (digest, CSV_PATH, byte_offset, chunk_number,
+          sorted(competition_ids), sorted(shooter_sids)))
+
+
+def write_batch(cur, batch):
+    """Stage 5: insert one Batch. Returns row counts per table."""
+    inserted_aggregates = []
+    if batch.aggregates:
+        inserted_aggregates = execute_values(
             cur,
             """INSERT INTO aggregates
-               (competition_id, match_number, match_name, discipline, place, shooter_sid, state, info, score)
-               VALUES %s;""",
-            agg_data,
-            page_size=1000
+               (competition_id, match_number, match_name, discipline, norm_discipline, place, shooter_sid, state, info, score)
+               VALUES %s
+               RETURNING aggregate_id;""",
+            batch.aggregates,
+            page_size=1000,
+            fetch=True
         )
-        conn.commit()
-    print(f"Inserted {len(agg_data)} aggregates.")
-
-    # Insert strings
-    print("Inserting strings...")
-    string_records = []
-    for row in strings:
-        string_records.append((
-            comp_map[row['competition']],
-            int(row['match_number']) if row['match_number'] else None,
-            row['match_name'],
-            int(row['distance']) if row['distance'] else None,
-            row['distance_unit'],
-            row['discipline'],
-            int(row['place']) if row['place'] else None,
-            row['sid'],
-            row['state'],
-            row['shots'],
-            row['info'],
-            float(row['score']) if row['score'] else None
-        ))
-
-    # Track which string_ids we're adding
-    cur.execute("SELECT COALESCE(MAX(string_id), 0) FROM strings;")
-    start_string_id = cur.fetchone()[0]
-
-    if string_records:
-        execute_values(
+
+    inserted_strings = []
+    if batch.strings:
+        inserted_strings = execute_values(
             cur,
             """INSERT INTO strings
-               (competition_id, match_number, match_name, distance, distance_unit, discipline, place, shooter_sid, state, shots_raw, info, score)
-               VALUES %s;""",
-            string_records,
-            page_size=1000
+               (competition_id, match_number, match_name, distance, distance_unit, discipline, norm_discipline, place, shooter_sid, state, shots_raw, info, score, mcsi, on_60s)
+               VALUES %s
+               RETURNING string_id, shots_raw;""",
+            batch.strings,
+            page_size=1000,
+            fetch=True
         )
-        conn.commit()
-    print(f"Inserted {len(string_records)} strings.")
-
-    # Insert shots for NEW strings only
-    print("Parsing and inserting shots...")
-    cur.execute(
-        "SELECT string_id, shots_raw FROM strings WHERE string_id > %s AND shots_raw IS NOT NULL AND shots_raw != '';",
-        (start_string_id,)
-    )
-
-    shots_data = []
-    for string_id, shots_raw in cur.fetchall():
-        for shot_num, shot_val in parse_shots(shots_raw):
-            shots_data.append((string_id, shot_num, shot_val))
 
+    # Insert shots for the strings just added
+    shots_data = [
+        (string_id, shot_num, shot_val)
+        for string_id, shots_raw in inserted_strings
+        for shot_num, shot_val in parse_shots(shots_raw)
+    ]
     if shots_data:
         execute_values(
             cur,
@@ -244,76 +363,143 @@ def import_data(conn):
             shots_data,
             page_size=5000
         )
-        conn.commit()
-    print(f"Inserted {len(shots_data)} individual shots.")
-
-    # Insert unmatched
-    if unmatched:
-        print(f"Inserting {len(unmatched)} unmatched results...")
-        unmatched_data = [
-            (
-                row['competition'],
-                int(row['match_number']) if row['match_number'] else None,
-                row['match_name'],
-                int(row['distance']) if row['distance'] else None,
-                row['distance_unit'],
-                row['discipline'],
-                int(row['place']) if row['place'] else None,
-                row['full_name'],
-                row['last_name'],
-                row['first_name'],
-                row['club'],
-                row['state'],
-                row['shots'],
-                row['info'],
-                float(row['score']) if row['score'] else None,
-                row['is_aggregate']
-            )
-            for row in unmatched
-        ]
+        # Keep the shot-sequence cube in step, inside the same transaction
+        add_shot_sequence(cur, [string_id for string_id, shots_raw in inserted_strings if shots_raw])
+
+    # Shooter results index for head-to-head comparisons
+    index_results(cur, [row[0] for row in inserted_aggregates],
+                  [string_id for string_id, _ in inserted_strings])
 
+    if batch.unmatched:
         execute_values(
             cur,
             """INSERT INTO unmatched_results
                (competition, match_number, match_name, distance, distance_unit, discipline, place,
                 full_name, last_name, first_name, club, state, shots, info, score, is_aggregate)
                VALUES %s;""",
-            unmatched_data,
+            batch.unmatched,
             page_size=1000
         )
+
+    return {
+        'aggregates': len(batch.aggregates),
+        'strings': len(batch.strings),
+        'shots': len(shots_data),
+        'unmatched': len(batch.unmatched),
+    }
+
+
+def import_data(conn, restart=False):
+    """Import results data from CSV in checkpointed chunks.
+
+    Rows stream through read -> parse -> match -> route -> write stages, so
+    only one chunk is held in memory at a time. Each chunk, together with
+    its checkpoint row, is committed atomically, so an interrupted import
+    resumes after the last committed chunk.
+    Returns (file_hash, competition_ids, shooter_sids) for the whole file,
+    plus the rows this run inserted per table and per competition, or None
+    if the file has already been imported.
+    """
+    cur = conn.cursor()
+
+    print(f"Importing from: {CSV_PATH}")
+    digest = file_hash(CSV_PATH)
+
+    if restart:
+        cur.execute("DELETE FROM import_checkpoints WHERE file_hash = %s;", (digest,))
         conn.commit()
 
+    checkpoint = load_checkpoint(cur, digest)
+    start_offset, chunk_number = 0, 0
+    if checkpoint:
+        byte_offset, last_chunk, _, _, completed = checkpoint
+        if completed:
+            print("This file has already been imported (use --restart to import it again).")
+            return None
+        start_offset, chunk_number = byte_offset, last_chunk
+        print(f"Resuming after chunk {last_chunk} (byte {byte_offset})")
 
-def verify_import(conn):
-    """Show current database stats."""
+    # Build shooter lookup
+    print("Building shooter lookup...")
+    lookup, name_only_lookup = build_shooter_lookup(conn)
+    print(f"Lookup has {len(lookup)} entries (with club), {len(name_only_lookup)} entries (name only)")
+
+    comp_cache = {}  # competition name -> (competition_id, state_code, year)
+
+    def resolve_competition(comp_name):
+        if comp_name not in comp_cache:
+            state_code, year = parse_competition_name(comp_name)
+            comp_cache[comp_name] = (get_or_create_competition(cur, state_code, year), state_code, year)
+        return comp_cache[comp_name]
+
+    totals = {'aggregates': 0, 'strings': 0, 'shots': 0, 'unmatched': 0}
+    competition_deltas = {}  # competition_id -> rows inserted by this run
+
+    print(f"Importing in chunks of {CHUNK_ROWS} rows...")
+    try:
+        for batch in pipeline(CSV_PATH, start_offset, resolve_competition, lookup, name_only_lookup):
+            chunk_number += 1
+            counts = write_batch(cur, batch)
+            refresh_summaries(cur, batch.competition_ids, batch.shooter_sids)
+            refresh_event_mcsi(cur, batch.competition_ids)
+            save_checkpoint(cur, digest, batch.end_offset, chunk_number,
+                            batch.competition_ids, batch.shooter_sids)
+            conn.commit()
+
+            for key, n in counts.items():
+                totals[key] += n
+            for table in ('aggregates', 'strings'):
+                for row in getattr(batch, table):
+                    delta = competition_deltas.setdefault(row[0], {'aggregates': 0, 'strings': 0})
+                    delta[table] += 1
+            print(f"  Chunk {chunk_number}: {counts['aggregates']} aggregates, {counts['strings']} strings, "
+                  f"{counts['shots']} shots, {counts['unmatched']} unmatched")
+    except Exception:
+        conn.rollback()
+        # Competitions created in the failed chunk were rolled back too
+        comp_cache.clear()
+        print(f"Import stopped in chunk {chunk_number}; rerun to resume from the last checkpoint.")
+        raise
+
+    print(f"Inserted {totals['aggregates']} aggregates, {totals['strings']} strings, "
+          f"{totals['shots']} shots, {totals['unmatched']} unmatched results.")
+
+    _, _, competition_ids, shooter_sids, _ = load_checkpoint(cur, digest)
+    inserted = {'aggregates': totals['aggregates'], 'strings': totals['strings'],
+                'shots': totals['shots'], 'unmatched_results': totals['unmatched']}
+    return digest, set(competition_ids), set(shooter_sids), inserted, competition_deltas
+
+
+def finish_import(conn, digest, competition_ids, shooter_sids):
+    """Post-import steps, safe to repeat if a previous run died part-way through."""
     cur = conn.cursor()
 
-    print("\n=== Database Stats ===")
+    # Field size and percentile rank within each field
+    print("Ranking results within their fields...")
+    update_field_ranks(cur, competition_ids)
+    conn.commit()
+
+    # A replay or rewind can change shooters outside this import
+    rated_sids = update_ratings(conn, competition_ids)
+
+    cur.execute("UPDATE import_checkpoints SET completed = TRUE WHERE file_hash = %s;", (digest,))
+    record_import_run(conn, competition_ids, shooter_sids | rated_sids)
 
-    # Competitions by year
-    cur.execute("""
-        SELECT s.code, c.year, COUNT(DISTINCT a.aggregate_id) as aggs, COUNT(DISTINCT st.string_id) as strings
-        FROM competitions c
-        JOIN states s ON c.state_id = s.state_id
-        LEFT JOIN aggregates a ON a.competition_id = c.competition_id
-        LEFT JOIN strings st ON st.competition_id = c.competition_id
-        GROUP BY s.code, c.year
-        ORDER BY c.year, s.code;
-    """)
-    print("\nCompetitions:")
-    for code, year, aggs, strings in cur.fetchall():
-        print(f"  {code} {year}: {aggs} aggregates, {strings} strings")
 
-    # Totals
-    tables = ['competitions', 'aggregates', 'strings', 'shots', 'unmatched_results']
-    print("\nTotals:")
-    for table in tables:
-        cur.execute(f"SELECT COUNT(*) FROM {table};")
-        print(f"  {table}: {cur.fetchone()[0]}")
+def record_import_run(conn, competition_ids, shooter_sids):
+    """Record which competitions and shooters an import touched."""
+    run_id = record_run(conn, CSV_PATH, competition_ids, shooter_sids)
+    print(f"Recorded import run {run_id}: {len(competition_ids)} competitions, {len(shooter_sids)} shooters.")
+    return run_id
 
 
 if __name__ == "__main__":
     conn = get_connection()
-    import_data(conn)
-    verify_import(conn)
+    ensure_schema(conn)
+    before_totals = table_totals(conn.cursor())
+    result = import_data(conn, restart='--restart' in sys.argv[1:])
+    if result is not None:
+        digest, competition_ids, shooter_sids, inserted, competition_deltas = result
+        finish_import(conn, digest, competition_ids, shooter_sids)
+        print_run_diff(conn.cursor(), before_totals, inserted, competition_deltas)
     conn.close()
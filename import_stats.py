@@ -0,0 +1,109 @@
+"""Post-import statistics.
+
+Per-competition counts come from independent grouped subqueries over just
+the competitions an import touched, so aggregates and strings are never
+joined to each other. Whole-table totals for the large tables use the
+planner's row estimates (pg_class.reltuples) taken before the import plus
+the rows the importer knows it inserted, instead of COUNT(*) scans.
+
+Usage:
+    python import_stats.py [COMPETITION_ID ...]    # current counts
+"""
+import sys
+
+from db import get_connection
+
+# Tables whose totals come from planner estimates rather than COUNT(*)
+ESTIMATED_TABLES = ['aggregates', 'strings', 'shots', 'unmatched_results']
+
+
+def table_totals(cur):
+    """Exact competition count plus estimated row counts for the large tables."""
+    cur.execute("SELECT COUNT(*) FROM competitions;")
+    totals = {'competitions': cur.fetchone()[0]}
+
+    cur.execute("""
+        SELECT relname, reltuples::bigint
+        FROM pg_class
+        WHERE relname = ANY(%s) AND relkind = 'r' AND relnamespace = 'public'::regnamespace;
+    """, (ESTIMATED_TABLES,))
+    estimates = dict(cur.fetchall())
+    for table in ESTIMATED_TABLES:
+        # reltuples is -1 (or 0) until the table has been analyzed
+        totals[table] = max(estimates.get(table, 0), 0)
+    return totals
+
+
+def competition_counts(cur, competition_ids=None):
+    """{competition_id: {'state', 'year', 'aggregates', 'strings'}} for the given (or all) competitions."""
+    if competition_ids is None:
+        inner, outer = '', ''
+    else:
+        inner = 'WHERE competition_id = ANY(%(ids)s)'
+        outer = 'WHERE c.competition_id = ANY(%(ids)s)'
+    cur.execute(f"""
+        SELECT c.competition_id, s.code, c.year,
+               COALESCE(a.n, 0), COALESCE(st.n, 0)
+        FROM competitions c
+        JOIN states s ON c.state_id = s.state_id
+        LEFT JOIN (
+            SELECT competition_id, COUNT(*) AS n FROM aggregates {inner} GROUP BY competition_id
+        ) a ON a.competition_id = c.competition_id
+        LEFT JOIN (
+            SELECT competition_id, COUNT(*) AS n FROM strings {inner} GROUP BY competition_id
+        ) st ON st.competition_id = c.competition_id
+        {outer}
+        ORDER BY c.year, s.code;
+    """, {'ids': list(competition_ids or [])})
+    return {
+        comp_id: {'state': code, 'year': year, 'aggregates': aggs, 'strings': strings}
+        for comp_id, code, year, aggs, strings in cur.fetchall()
+    }
+
+
+def print_counts(counts):
+    print("\nCompetitions:")
+    for c in counts.values():
+        print(f"  {c['state']} {c['year']}: {c['aggregates']} aggregates, {c['strings']} strings")
+
+
+def print_run_diff(cur, before_totals, inserted, competition_deltas):
+    """Print what an import run changed.
+
+    before_totals is table_totals() from before the run, inserted the rows
+    the importer wrote per table, and competition_deltas maps competition id
+    to {'aggregates': n, 'strings': n} written by this run.
+    """
+    after = competition_counts(cur, list(competition_deltas))
+
+    print("\n=== Import Run ===")
+    print("\nCompetitions touched (before -> after):")
+    for comp_id, c in after.items():
+        delta = competition_deltas.get(comp_id, {})
+        parts = []
+        for table in ('aggregates', 'strings'):
+            added = delta.get(table, 0)
+            parts.append(f"{table} {c[table] - added} -> {c[table]} (+{added})")
+        new = ' [new]' if c['aggregates'] + c['strings'] == sum(delta.values()) else ''
+        print(f"  {c['state']} {c['year']}{new}: " + ', '.join(parts))
+
+    cur.execute("SELECT COUNT(*) FROM competitions;")
+    competitions_after = cur.fetchone()[0]
+
+    print("\nTotals (large tables estimated):")
+    print(f"  competitions: {before_totals['competitions']} -> {competitions_after} "
+          f"(+{competitions_after - before_totals['competitions']})")
+    for table in ESTIMATED_TABLES:
+        added = inserted.get(table, 0)
+        print(f"  {table}: ~{before_totals[table]} -> ~{before_totals[table] + added} (+{added})")
+
+
+if __name__ == "__main__":
+    conn = get_connection()
+    cur = conn.cursor()
+    ids = [int(arg) for arg in sys.argv[1:]] or None
+    print_counts(competition_counts(cur, ids))
+    print("\nTotals (large tables estimated):")
+    for table, n in table_totals(cur).items():
+        print(f"  {table}: {n}")
+    conn.close()
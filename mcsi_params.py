@@ -0,0 +1,349 @@
+"""Year-versioned MCSI parameters and 60-point target rules.
+
+Parameters live in mcsi_params keyed by (year, state_code, discipline),
+where state_code '*' applies to every state and discipline is the
+normalized name. A competition uses its state's row for its own year or
+the nearest earlier year, then the '*' row likewise. Only when neither
+has an earlier year does it fall back to the earliest year on record.
+target_conversions lists the (year, state, discipline) slices shot on
+60-point targets.
+
+Usage:
+    python mcsi_params.py set YEAR STATE DISCIPLINE MULTIPLIER OFFSET
+    python mcsi_params.py convert YEAR STATE DISCIPLINE [--remove]
+    python mcsi_params.py recompute [YEAR [STATE [DISCIPLINE]]]
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from db import get_connection
+
+ALL_STATES = '*'
+
+# Seeded into mcsi_params for DEFAULT_YEAR when the table is created
+# Formula: MCSI = ((Score + Centres) × Multiplier) + Offset
+DEFAULT_YEAR = 2025
+DEFAULT_PARAMS = {
+    'F-Open': {'multiplier': 1.42, 'offset': 1.8},
+    'F-Std-A': {'multiplier': 1.42, 'offset': 1.8},
+    'F-Std-B': {'multiplier': 1.42, 'offset': 1.8},
+    'F-Std-Open': {'multiplier': 1.42, 'offset': 1.8},
+    'FTR': {'multiplier': 1.42, 'offset': 1.8},
+    'TR-A': {'multiplier': 1.62, 'offset': 8.4},
+    'TR-B': {'multiplier': 1.62, 'offset': 8.4},
+    'TR-C': {'multiplier': 1.62, 'offset': 8.4},
+    'Sporter-Open': {'multiplier': 1.5, 'offset': 12},
+    'Sporter-PC': {'multiplier': 1.5, 'offset': 12},
+}
+
+# VRA 2025 Sporter disciplines were shot on 60s
+DEFAULT_CONVERSIONS = [
+    (2025, 'VRA', 'Sporter-Open'),
+    (2025, 'VRA', 'Sporter-PC'),
+]
+
+# How long a process trusts its copy of the parameter tables
+PARAMS_TTL = float(os.getenv('MCSI_PARAMS_TTL', 300))
+
+
+class ParamTable:
+    """In-process copy of mcsi_params and target_conversions."""
+
+    def __init__(self, param_rows, conversion_rows):
+        # (state_code, discipline) -> sorted years, and matching params
+        self._years = {}
+        self._params = {}
+        for year, state_code, discipline, multiplier, offset in sorted(param_rows):
+            key = (state_code, discipline)
+            self._years.setdefault(key, []).append(year)
+            self._params.setdefault(key, []).append(
+                {'multiplier': float(multiplier), 'offset': float(offset)}
+            )
+        self._conversions = {tuple(row) for row in conversion_rows}
+        self._resolved = {}
+
+    def _for_key(self, key, year, earliest=False):
+        """Params for the key's latest year <= year; its earliest year if allowed."""
+        years = self._years.get(key)
+        if not years:
+            return None
+        if year is None:
+            return self._params[key][-1]
+        i = bisect.bisect_right(years, year)
+        if i == 0:
+            return self._params[key][0] if earliest else None
+        return self._params[key][i - 1]
+
+    def lookup(self, year, state_code, discipline):
+        """Parameters for a normalized discipline, or None if it has none.
+
+        A state row only applies from its own year on, so adding a new
+        season's state row never changes that state's earlier results.
+        """
+        cache_key = (year, state_code, discipline)
+        if cache_key not in self._resolved:
+            keys = [(ALL_STATES, discipline)]
+            if state_code and state_code != ALL_STATES:
+                keys.insert(0, (state_code, discipline))
+            # Nearest earlier year (state row first), then the earliest
+            # year on record ('*' row first) if nothing is earlier
+            candidates = [(key, False) for key in keys] + [(key, True) for key in reversed(keys)]
+            params = None
+            for key, earliest in candidates:
+                params = self._for_key(key, year, earliest)
+                if params is not None:
+                    break
+            self._resolved[cache_key] = params
+        return self._resolved[cache_key]
+
+    def is_60_point(self, year, state_code, discipline):
+        return ((year, state_code, discipline) in self._conversions
+                or (year, ALL_STATES, discipline) in self._conversions)
+
+
+def load_table(cur):
+    cur.execute('SELECT year, state_code, discipline, multiplier, "offset" FROM mcsi_params;')
+    param_rows = cur.fetchall()
+    cur.execute("SELECT year, state_code, discipline FROM target_conversions;")
+    conversion_rows = cur.fetchall()
+    return ParamTable(param_rows, conversion_rows)
+
+
+_lock = threading.Lock()
+_current = {'table': None, 'loaded_at': 0.0}
+
+
+def get_table():
+    """Return the cached ParamTable, reloading it every PARAMS_TTL seconds."""
+    now = time.monotonic()
+    if _current['table'] is None or now - _current['loaded_at'] >= PARAMS_TTL:
+        with _lock:
+            if _current['table'] is None or now - _current['loaded_at'] >= PARAMS_TTL:
+                conn = get_connection()
+                try:
+                    _current['table'] = load_table(conn.cursor())
+                finally:
+                    conn.close()
+                _current['loaded_at'] = now
+    return _current['table']
+
+
+def invalidate():
+    """Force the next lookup to reload the tables."""
+    _current['table'] = None
+
+
+def seed_statements():
+    """INSERT statements for the default parameter and conversion rows."""
+    params = ', '.join(
+        f"({DEFAULT_YEAR}, '{ALL_STATES}', '{disc}', {p['multiplier']}, {p['offset']})"
+        for disc, p in DEFAULT_PARAMS.items()
+    )
+    conversions = ', '.join(
+        f"({year}, '{state}', '{disc}')" for year, state, disc in DEFAULT_CONVERSIONS
+    )
+    return [
+        f'INSERT INTO mcsi_params (year, state_code, discipline, multiplier, "offset") '
+        f'VALUES {params} ON CONFLICT DO NOTHING;',
+        f"INSERT INTO target_conversions (year, state_code, discipline) "
+        f"VALUES {conversions} ON CONFLICT DO NOTHING;",
+    ]
+
+
+def _write_mcsi(cur, updates):
+    execute_values(
+        cur,
+        """UPDATE strings AS st SET mcsi = v.mcsi
+           FROM (VALUES %s) AS v(string_id, mcsi)
+           WHERE st.string_id = v.string_id;""",
+        updates,
+        template='(%s, %s::numeric)',
+        page_size=5000
+    )
+    # Keep the head-to-head index in step (see head_to_head.py)
+    execute_values(
+        cur,
+        """UPDATE shooter_results AS r SET mcsi = v.mcsi
+           FROM (VALUES %s) AS v(string_id, mcsi)
+           WHERE r.is_aggregate = FALSE AND r.result_id = v.string_id;""",
+        updates,
+        template='(%s, %s::numeric)',
+        page_size=5000
+    )
+
+
+def recompute(conn, year=None, state_code=None, discipline=None):
+    """Recompute stored strings.mcsi and on_60s for one (year, state, discipline) slice.
+
+    Any of the filters may be None to widen the slice. Only rows whose value
+    actually changes are written. Parameters are read in the caller's
+    transaction and nothing is committed; publish() commits. Returns the
+    competition ids and shooter SIDs touched.
+    """
+    from conversions import update_on_60s
+    from scoring import calculate_mcsi, original_disciplines
+
+    table = load_table(conn.cursor())
+    update_on_60s(conn.cursor(), year, state_code, discipline)
+
+    filters = ['st.score IS NOT NULL']
+    params = []
+    if year is not None:
+        filters.append('c.year = %s')
+        params.append(year)
+    if state_code not in (None, ALL_STATES):
+        filters.append('s.code = %s')
+        params.append(state_code)
+    if discipline is not None:
+        filters.append('st.discipline = ANY(%s)')
+        params.append(original_disciplines(discipline))
+
+    # Stream the slice through a server-side cursor so memory stays bounded
+    read_cur = conn.cursor(name='mcsi_recompute')
+    read_cur.itersize = 5000
+    read_cur.execute(f'''
+        SELECT st.string_id, st.competition_id, st.shooter_sid, st.discipline, st.score,
+               st.shots_raw, c.year, s.code, st.mcsi
+        FROM strings st
+        JOIN competitions c ON st.competition_id = c.competition_id
+        JOIN states s ON c.state_id = s.state_id
+        WHERE {' AND '.join(filters)};
+    ''', params)
+
+    write_cur = conn.cursor()
+    updates = []
+    updated = 0
+    competition_ids = set()
+    shooter_sids = set()
+    for string_id, comp_id, sid, disc, score, shots_raw, yr, code, old_mcsi in read_cur:
+        mcsi = calculate_mcsi(score, disc, code, yr, shots_raw, table)
+        if old_mcsi is None and mcsi is None:
+            continue
+        if old_mcsi is not None and mcsi is not None and float(old_mcsi) == mcsi:
+            continue
+        updates.append((string_id, mcsi))
+        competition_ids.add(comp_id)
+        shooter_sids.add(sid)
+        if len(updates) >= 5000:
+            _write_mcsi(write_cur, updates)
+            updated += len(updates)
+            updates = []
+
+    if updates:
+        _write_mcsi(write_cur, updates)
+        updated += len(updates)
+    read_cur.close()
+    print(f"Recomputed MCSI for {updated} strings in {len(competition_ids)} competitions.")
+    return competition_ids, shooter_sids
+
+
+def _affected_slices(cur, before, after, discipline):
+    """(year, state_code) pairs whose resolved params or conversion changed."""
+    cur.execute("""
+        SELECT DISTINCT c.year, s.code
+        FROM competitions c
+        JOIN states s ON c.state_id = s.state_id;
+    """)
+    return [
+        (year, code) for year, code in cur.fetchall()
+        if before.lookup(year, code, discipline) != after.lookup(year, code, discipline)
+        or before.is_60_point(year, code, discipline) != after.is_60_point(year, code, discipline)
+    ]
+
+
+def _apply_change(conn, discipline, statement, args):
+    """Run a parameter change and recompute just the slices it affects.
+
+    The change, the recomputed strings and the event snapshots commit
+    together, so a failure part-way leaves everything as it was.
+    """
+    cur = conn.cursor()
+    try:
+        before = load_table(cur)
+        cur.execute(statement, args)
+        after = load_table(cur)
+
+        competition_ids = set()
+        shooter_sids = set()
+        for year, code in _affected_slices(cur, before, after, discipline):
+            comp_ids, sids = recompute(conn, year, code, discipline)
+            competition_ids |= comp_ids
+            shooter_sids |= sids
+        publish(conn, competition_ids, shooter_sids)
+    except Exception:
+        conn.rollback()
+        raise
+    return competition_ids
+
+
+def publish(conn, competition_ids, shooter_sids):
+    """Refresh what is derived from stored MCSI, commit and bump the data version.
+
+    The run lists the shooters whose strings changed, since shooter pages
+    show MCSI too.
+    """
+    from event_mcsi import refresh as refresh_event_mcsi
+    from schema import record_run
+
+    # Event rankings are built from the stored MCSI (see event_mcsi.py)
+    refresh_event_mcsi(conn.cursor(), competition_ids)
+    conn.commit()
+    invalidate()
+    # Bump the data version so cached pages for these competitions refresh
+    if competition_ids:
+        record_run(conn, 'mcsi_params', competition_ids, shooter_sids)
+
+
+def set_params(conn, year, state_code, discipline, multiplier, offset):
+    """Insert or update one parameter row and recompute what it affects."""
+    return _apply_change(conn, discipline, '''
+        INSERT INTO mcsi_params (year, state_code, discipline, multiplier, "offset")
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (year, state_code, discipline) DO UPDATE
+        SET multiplier = EXCLUDED.multiplier, "offset" = EXCLUDED."offset", updated_at = now();
+    ''', (year, state_code, discipline, multiplier, offset))
+
+
+def set_conversion(conn, year, state_code, discipline, enabled=True):
+    """Mark (or unmark) a slice as shot on 60-point targets and recompute it."""
+    if enabled:
+        statement = '''
+            INSERT INTO target_conversions (year, state_code, discipline)
+            VALUES (%s, %s, %s) ON CONFLICT DO NOTHING;
+        '''
+    else:
+        statement = '''
+            DELETE FROM target_conversions
+            WHERE year = %s AND state_code = %s AND discipline = %s;
+        '''
+    return _apply_change(conn, discipline, statement, (year, state_code, discipline))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    conn = get_connection()
+    command = args[0]
+    if command == 'set':
+        year, state_code, discipline, multiplier, offset = args[1:6]
+        set_params(conn, int(year), state_code, discipline, float(multiplier), float(offset))
+    elif command == 'convert':
+        year, state_code, discipline = args[1:4]
+        set_conversion(conn, int(year), state_code, discipline, enabled='--remove' not in args)
+    elif command == 'recompute':
+        year = int(args[1]) if len(args) > 1 else None
+        state_code = args[2] if len(args) > 2 else None
+        discipline = args[3] if len(args) > 3 else None
+        publish(conn, *recompute(conn, year, state_code, discipline))
+    else:
+        print(__doc__)
+        sys.exit(1)
+    conn.close()
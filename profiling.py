@@ -0,0 +1,241 @@
+"""Opt-in request profiling.
+
+Set PROFILE_DIR to enable. A PROFILE_SAMPLE_RATE fraction of requests is
+profiled, plus any request carrying a valid X-Profile-Token header: the
+hex HMAC-SHA256 of the request path keyed with PROFILE_SECRET, e.g.
+
+    python -c "import hmac,hashlib; print(hmac.new(b'SECRET', b'/event/12/mcsi', hashlib.sha256).hexdigest())"
+
+Each profiled request runs under cProfile while a background thread
+samples its stack every PROFILE_INTERVAL seconds. Both are written per
+route under PROFILE_DIR:
+
+    <route>/<timestamp>-<ms>ms.pstats      (python -m pstats, snakeviz)
+    <route>/<timestamp>-<ms>ms.collapsed   (flamegraph.pl, speedscope)
+    <route>/<timestamp>-<ms>ms.json        (summary with the top functions)
+
+Only the PROFILE_KEEP slowest captures are kept on disk. GET
+/admin/profiles (signed the same way) lists them, from every worker, with
+their top functions.
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Blueprint, abort, g, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+SECRET = os.getenv('PROFILE_SECRET', '')
+INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+KEEP_SLOWEST = int(os.getenv('PROFILE_KEEP', 50))
+TOKEN_HEADER = 'X-Profile-Token'
+
+profiling_bp = Blueprint('profiling', __name__)
+
+# cProfile allows one active profiler per process on newer Pythons
+_active = threading.Lock()
+_CAPTURE_MS = re.compile(r'-(\d+)ms\.json$')
+
+
+def valid_token(path, token):
+    if not SECRET or not token:
+        return False
+    expected = hmac.new(SECRET.encode(), path.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, token)
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def route_name(rule):
+    """Filesystem-safe name for a URL rule, e.g. /event/<int:comp_id>/mcsi -> event_comp_id_mcsi."""
+    name = re.sub(r'<(?:[^:>]+:)?([^>]+)>', r'\1', rule or 'unmatched')
+    return re.sub(r'[^A-Za-z0-9_]+', '_', name).strip('_') or 'index'
+
+
+def top_functions(stats, limit=10):
+    stats.sort_stats('cumulative')
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        _, ncalls, tottime, cumtime, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            'function': f'{name} ({os.path.basename(filename)}:{line})',
+            'calls': ncalls,
+            'tottime_ms': round(tottime * 1000, 2),
+            'cumtime_ms': round(cumtime * 1000, 2),
+        })
+    return rows
+
+
+def _start():
+    if request.path == '/admin/profiles':
+        return
+    forced = valid_token(request.path, request.headers.get(TOKEN_HEADER))
+    if not forced and (SAMPLE_RATE <= 0 or random.random() >= SAMPLE_RATE):
+        return
+    if not _active.acquire(blocking=False):
+        return
+
+    g.profile = cProfile.Profile()
+    g.sampler = StackSampler(threading.get_ident())
+    g.profile_started = time.perf_counter()
+    g.sampler.start()
+    g.profile.enable()
+
+
+def _finish(response):
+    profile = g.get('profile')
+    if profile is None:
+        return response
+    try:
+        profile.disable()
+        elapsed_ms = (time.perf_counter() - g.profile_started) * 1000
+        g.sampler.stop()
+        _save(profile, g.sampler, elapsed_ms, response.status_code)
+        _prune()
+    except Exception:
+        logger.exception("Failed to save request profile")
+    return response
+
+
+def _teardown(exc):
+    """Stop profiling and free the profiler, even if the view raised."""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return
+    try:
+        profile.disable()
+        g.pop('sampler').stop()
+    finally:
+        _active.release()
+
+
+def _save(profile, sampler, elapsed_ms, status):
+    route = route_name(request.url_rule.rule if request.url_rule else None)
+    directory = os.path.join(PROFILE_DIR, route)
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{elapsed_ms:.0f}ms')
+
+    profile.dump_stats(base + '.pstats')
+    with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f'{stack} {count}\n')
+
+    capture = {
+        'route': route,
+        'path': request.full_path.rstrip('?'),
+        'status': status,
+        'ms': round(elapsed_ms, 1),
+        'samples': sum(sampler.stacks.values()),
+        'pstats': base + '.pstats',
+        'collapsed': base + '.collapsed',
+        'pid': os.getpid(),
+        'top': top_functions(pstats.Stats(profile, stream=io.StringIO())),
+    }
+    # Write then rename, so the listing never reads a half-written summary
+    with open(base + '.json.tmp', 'w', encoding='utf-8') as f:
+        json.dump(capture, f)
+    os.replace(base + '.json.tmp', base + '.json')
+
+
+def _capture_files():
+    """(ms, summary path) for every capture under PROFILE_DIR, slowest first.
+
+    Durations are read from the file names, so no summary is opened.
+    """
+    found = []
+    for route in os.listdir(PROFILE_DIR):
+        directory = os.path.join(PROFILE_DIR, route)
+        if not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            match = _CAPTURE_MS.search(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(found, reverse=True)
+
+
+def _prune(keep=KEEP_SLOWEST):
+    """Delete every capture but the slowest keep, across all workers."""
+    for _, path in _capture_files()[keep:]:
+        base = path[:-len('.json')]
+        for suffix in ('.json', '.pstats', '.collapsed'):
+            try:
+                os.remove(base + suffix)
+            except FileNotFoundError:
+                pass  # another worker pruned it first
+
+
+def slowest_captures(limit=KEEP_SLOWEST):
+    """Summaries of the slowest captures under PROFILE_DIR, slowest first."""
+    captures = []
+    for _, path in _capture_files()[:limit]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                captures.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # removed or unreadable since listing
+    captures.sort(key=lambda c: c['ms'], reverse=True)
+    return captures
+
+
+@profiling_bp.route('/admin/profiles')
+def list_profiles():
+    """Slowest profiled requests across all workers, slowest first."""
+    if not valid_token(request.path, request.headers.get(TOKEN_HEADER)):
+        abort(404)
+    return jsonify({'sample_rate': SAMPLE_RATE, 'captures': slowest_captures()})
+
+
+def init_app(app):
+    """Install the profiling hooks if PROFILE_DIR is set."""
+    if not PROFILE_DIR:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_teardown)
+    app.register_blueprint(profiling_bp)
+    logger.info("Profiling %.1f%% of requests (plus signed ones) into %s",
+                SAMPLE_RATE * 100, PROFILE_DIR)
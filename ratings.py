@@ -0,0 +1,277 @@
+"""Running Elo-style shooter ratings across events.
+
+Each Grand aggregate field (competition, match, normalized discipline) is
+treated as a multi-player game: every shooter is scored against every other
+shooter in the field by place. Competitions are applied in chronological
+order and a snapshot of each shooter's rating is stored per competition.
+
+Usage:
+    python ratings.py            # apply any competitions not yet rated
+    python ratings.py --replay   # rebuild all ratings from scratch
+"""
+import sys
+from collections import defaultdict
+
+from psycopg2.extras import execute_values
+
+from db import get_connection
+from scoring import normalize_discipline
+
+INITIAL_RATING = 1500.0
+K_PROVISIONAL = 40.0
+K_ESTABLISHED = 20.0
+PROVISIONAL_EVENTS = 5
+
+
+def field_deltas(field, ratings):
+    """Rating change for each shooter in a field of {sid: place}."""
+    n = len(field)
+    deltas = {}
+    for sid_i, place_i in field.items():
+        rating_i, events_i = ratings.get(sid_i, (INITIAL_RATING, 0))
+        expected = 0.0
+        actual = 0.0
+        for sid_j, place_j in field.items():
+            if sid_j == sid_i:
+                continue
+            rating_j = ratings.get(sid_j, (INITIAL_RATING, 0))[0]
+            expected += 1 / (1 + 10 ** ((rating_j - rating_i) / 400))
+            if place_i < place_j:
+                actual += 1
+            elif place_i == place_j:
+                actual += 0.5
+        k = K_PROVISIONAL if events_i < PROVISIONAL_EVENTS else K_ESTABLISHED
+        deltas[sid_i] = k * (actual - expected) / (n - 1)
+    return deltas
+
+
+def apply_competition(comp_id, fields, ratings):
+    """Apply one competition's fields to ratings in place. Returns snapshot rows."""
+    totals = defaultdict(float)
+    field_counts = defaultdict(int)
+    for field in fields:
+        if len(field) < 2:
+            continue
+        # Every field in a competition is scored against pre-competition ratings
+        for sid, delta in field_deltas(field, ratings).items():
+            totals[sid] += delta
+            field_counts[sid] += 1
+
+    rows = []
+    for sid, delta in totals.items():
+        before, events = ratings.get(sid, (INITIAL_RATING, 0))
+        after = before + delta
+        ratings[sid] = (after, events + 1)
+        rows.append((sid, comp_id, round(before, 2), round(after, 2), field_counts[sid]))
+    return rows
+
+
+def load_fields(cur, competition_ids):
+    """Return {competition_id: [ {sid: place}, ... ]} for Grand aggregates."""
+    cur.execute("""
+        SELECT competition_id, match_name, discipline, shooter_sid, place
+        FROM aggregates
+        WHERE competition_id = ANY(%s)
+          AND is_grand
+          AND place IS NOT NULL;
+    """, (list(competition_ids),))
+
+    fields = defaultdict(dict)
+    for comp_id, match_name, discipline, sid, place in cur.fetchall():
+        field = fields[(comp_id, match_name, normalize_discipline(discipline))]
+        # Keep a shooter's best place if the field lists them twice
+        if sid not in field or place < field[sid]:
+            field[sid] = place
+
+    by_competition = defaultdict(list)
+    for (comp_id, _, _), field in fields.items():
+        by_competition[comp_id].append(field)
+    return by_competition
+
+
+def write_competitions(cur, processed, snapshot_rows, ratings, sids, previous=None):
+    """Persist snapshots, progress and the current rating of the given shooters.
+
+    previous maps shooters who may have no snapshot in snapshot_rows to
+    the last competition they were rated in.
+    """
+    if snapshot_rows:
+        execute_values(
+            cur,
+            """INSERT INTO rating_snapshots (sid, competition_id, rating_before, rating, fields)
+               VALUES %s;""",
+            snapshot_rows,
+            page_size=1000
+        )
+
+    last_competition = dict(previous or {})
+    last_competition.update((row[0], row[1]) for row in snapshot_rows)
+    rating_rows = [
+        (sid, round(ratings[sid][0], 2), ratings[sid][1], last_competition.get(sid))
+        for sid in sids
+    ]
+    if rating_rows:
+        execute_values(
+            cur,
+            """INSERT INTO shooter_ratings (sid, rating, events, last_competition_id)
+               VALUES %s
+               ON CONFLICT (sid) DO UPDATE
+               SET rating = EXCLUDED.rating,
+                   events = EXCLUDED.events,
+                   last_competition_id = EXCLUDED.last_competition_id;""",
+            rating_rows,
+            page_size=1000
+        )
+
+    execute_values(
+        cur,
+        "INSERT INTO rating_progress (competition_id, year) VALUES %s;",
+        processed
+    )
+
+
+def replay_ratings(conn):
+    """Rebuild every rating from the full competition history.
+
+    Returns the SIDs of every shooter rated before or after the replay.
+    """
+    cur = conn.cursor()
+    print("Replaying ratings from full history...")
+
+    cur.execute("SELECT sid FROM shooter_ratings;")
+    previously_rated = {row[0] for row in cur.fetchall()}
+    cur.execute("TRUNCATE rating_snapshots, shooter_ratings, rating_progress;")
+    cur.execute("SELECT competition_id, year FROM competitions ORDER BY year, competition_id;")
+    competitions = cur.fetchall()
+    if not competitions:
+        conn.commit()
+        return previously_rated
+
+    fields = load_fields(cur, [comp_id for comp_id, _ in competitions])
+    ratings = {}
+    snapshot_rows = []
+    for comp_id, _ in competitions:
+        snapshot_rows.extend(apply_competition(comp_id, fields.get(comp_id, []), ratings))
+
+    write_competitions(cur, competitions, snapshot_rows, ratings, list(ratings))
+    conn.commit()
+    print(f"Rated {len(ratings)} shooters over {len(competitions)} competitions.")
+    return previously_rated | set(ratings)
+
+
+def rewind_competition(cur, comp_id):
+    """Undo the latest rated competition.
+
+    Returns {sid: (rating, events)} from before it for every shooter it
+    rated, and {sid: competition_id} of each one's previous competition.
+    """
+    cur.execute("""
+        SELECT rs.sid, rs.rating_before, sr.events - 1
+        FROM rating_snapshots rs
+        JOIN shooter_ratings sr ON sr.sid = rs.sid
+        WHERE rs.competition_id = %s;
+    """, (comp_id,))
+    ratings = {sid: (float(before), events) for sid, before, events in cur.fetchall()}
+
+    cur.execute("""
+        SELECT DISTINCT ON (rs.sid) rs.sid, rs.competition_id
+        FROM rating_snapshots rs
+        JOIN competitions c ON rs.competition_id = c.competition_id
+        WHERE rs.sid = ANY(%s) AND rs.competition_id <> %s
+        ORDER BY rs.sid, c.year DESC, c.competition_id DESC;
+    """, (list(ratings), comp_id))
+    previous = dict(cur.fetchall())
+
+    cur.execute("DELETE FROM rating_snapshots WHERE competition_id = %s;", (comp_id,))
+    cur.execute("DELETE FROM rating_progress WHERE competition_id = %s;", (comp_id,))
+    return ratings, previous
+
+
+def update_ratings(conn, competition_ids):
+    """Apply newly imported competitions, replaying history only when needed.
+
+    New competitions that sort after everything already rated are applied
+    on top of the stored ratings. Re-importing the latest rated competition
+    rewinds its shooters to their pre-competition snapshots and applies it
+    again. Re-importing an older competition, or importing one that sorts
+    before the latest rated competition, replays the whole history.
+    Returns the SIDs whose rating or history changed.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT competition_id, year FROM competitions
+        WHERE competition_id = ANY(%s)
+        ORDER BY year, competition_id;
+    """, (list(competition_ids),))
+    touched = cur.fetchall()
+    if not touched:
+        return set()
+
+    cur.execute("SELECT competition_id FROM rating_progress WHERE competition_id = ANY(%s);",
+                ([comp_id for comp_id, _ in touched],))
+    already_rated = {row[0] for row in cur.fetchall()}
+
+    cur.execute("""
+        SELECT year, competition_id FROM rating_progress
+        ORDER BY year DESC, competition_id DESC LIMIT 1;
+    """)
+    latest = cur.fetchone()
+    unrated = [(year, comp_id) for comp_id, year in touched if comp_id not in already_rated]
+
+    if already_rated - {latest[1] if latest else None} or \
+            (latest and unrated and unrated[0] < tuple(latest)):
+        return replay_ratings(conn)
+
+    rewound, previous = {}, {}
+    if already_rated:
+        rewound, previous = rewind_competition(cur, latest[1])
+
+    fields = load_fields(cur, [comp_id for comp_id, _ in touched])
+    sids = {sid for comp_fields in fields.values() for field in comp_fields for sid in field}
+    sids |= set(rewound)
+
+    cur.execute("SELECT sid, rating, events FROM shooter_ratings WHERE sid = ANY(%s);",
+                (list(sids),))
+    ratings = {sid: (float(rating), events) for sid, rating, events in cur.fetchall()}
+    ratings.update(rewound)
+
+    snapshot_rows = []
+    for comp_id, _ in touched:
+        snapshot_rows.extend(apply_competition(comp_id, fields.get(comp_id, []), ratings))
+
+    # Shooters the re-import dropped who had no other competition
+    unrated_sids = [sid for sid in rewound if ratings[sid][1] == 0]
+    if unrated_sids:
+        cur.execute("DELETE FROM shooter_ratings WHERE sid = ANY(%s);", (unrated_sids,))
+
+    changed = {row[0] for row in snapshot_rows} | (set(rewound) - set(unrated_sids))
+    write_competitions(cur, touched, snapshot_rows, ratings, changed, previous)
+    conn.commit()
+    print(f"Updated ratings for {len(touched)} competitions.")
+    return changed | set(unrated_sids)
+
+
+def rate_pending(conn):
+    """Apply every competition that has not been rated yet."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT c.competition_id FROM competitions c
+        LEFT JOIN rating_progress rp ON rp.competition_id = c.competition_id
+        WHERE rp.competition_id IS NULL;
+    """)
+    return update_ratings(conn, [row[0] for row in cur.fetchall()])
+
+
+if __name__ == "__main__":
+    from schema import ensure_schema, record_run
+
+    conn = get_connection()
+    ensure_schema(conn)
+    if '--replay' in sys.argv[1:]:
+        sids = replay_ratings(conn)
+    else:
+        sids = rate_pending(conn)
+    # Bump the data version so cached and exported shooter pages refresh
+    if sids:
+        record_run(conn, 'ratings', set(), sids)
+    conn.close()
@@ -0,0 +1,250 @@
+from db import get_connection
+from conversions import COLUMN_STATEMENTS as CONVERSION_COLUMNS, FUNCTION_STATEMENTS
+from event_mcsi import seed_statements as kings_queens_seed_statements
+from mcsi_params import seed_statements
+
+# Tables and columns layered on top of the core results schema
+# (states, competitions, aggregates, strings, shots, unmatched_results).
+# Every statement is idempotent so this can run before each import.
+SCHEMA_STATEMENTS = [
+    # One row per completed import, recording what it touched
+    """
+    CREATE TABLE IF NOT EXISTS import_runs (
+        run_id SERIAL PRIMARY KEY,
+        source VARCHAR(500),
+        finished_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        competition_ids INTEGER[] NOT NULL DEFAULT '{}',
+        shooter_sids INTEGER[] NOT NULL DEFAULT '{}'
+    );
+    """,
+    # Shooter ratings (see ratings.py)
+    """
+    CREATE TABLE IF NOT EXISTS shooter_ratings (
+        sid INTEGER PRIMARY KEY REFERENCES shooters(sid),
+        rating NUMERIC(7, 2) NOT NULL,
+        events INTEGER NOT NULL DEFAULT 0,
+        last_competition_id INTEGER REFERENCES competitions(competition_id)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS shooter_ratings_rating_idx ON shooter_ratings (rating DESC);",
+    """
+    CREATE TABLE IF NOT EXISTS rating_snapshots (
+        sid INTEGER NOT NULL REFERENCES shooters(sid),
+        competition_id INTEGER NOT NULL REFERENCES competitions(competition_id),
+        rating_before NUMERIC(7, 2) NOT NULL,
+        rating NUMERIC(7, 2) NOT NULL,
+        fields INTEGER NOT NULL,
+        PRIMARY KEY (sid, competition_id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rating_progress (
+        competition_id INTEGER PRIMARY KEY REFERENCES competitions(competition_id),
+        year INTEGER NOT NULL
+    );
+    """,
+    # Year-versioned MCSI parameters (see mcsi_params.py)
+    """
+    CREATE TABLE IF NOT EXISTS mcsi_params (
+        year INTEGER NOT NULL,
+        state_code VARCHAR(10) NOT NULL DEFAULT '*',
+        discipline VARCHAR(50) NOT NULL,
+        multiplier NUMERIC(6, 3) NOT NULL,
+        "offset" NUMERIC(6, 2) NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (year, state_code, discipline)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS target_conversions (
+        year INTEGER NOT NULL,
+        state_code VARCHAR(10) NOT NULL,
+        discipline VARCHAR(50) NOT NULL,
+        PRIMARY KEY (year, state_code, discipline)
+    );
+    """,
+    *seed_statements(),
+    "ALTER TABLE strings ADD COLUMN IF NOT EXISTS mcsi NUMERIC(7, 2);",
+    # Normalized discipline, field size and percentile (see field_ranks.py)
+    "ALTER TABLE aggregates ADD COLUMN IF NOT EXISTS norm_discipline VARCHAR(50);",
+    "ALTER TABLE aggregates ADD COLUMN IF NOT EXISTS field_size INTEGER;",
+    "ALTER TABLE aggregates ADD COLUMN IF NOT EXISTS percentile NUMERIC(5, 2);",
+    "ALTER TABLE strings ADD COLUMN IF NOT EXISTS norm_discipline VARCHAR(50);",
+    "ALTER TABLE strings ADD COLUMN IF NOT EXISTS field_size INTEGER;",
+    "ALTER TABLE strings ADD COLUMN IF NOT EXISTS percentile NUMERIC(5, 2);",
+    """CREATE INDEX IF NOT EXISTS aggregates_shooter_percentile_idx
+       ON aggregates (shooter_sid, percentile DESC NULLS LAST);""",
+    """CREATE INDEX IF NOT EXISTS strings_shooter_percentile_idx
+       ON strings (shooter_sid, percentile DESC NULLS LAST);""",
+    """CREATE INDEX IF NOT EXISTS aggregates_discipline_field_idx
+       ON aggregates (norm_discipline, field_size, percentile DESC);""",
+    # Database-side 60-to-50 conversion (see conversions.py)
+    *FUNCTION_STATEMENTS,
+    *CONVERSION_COLUMNS,
+    # Shot value counts by position in the string (see shot_sequence.py)
+    """
+    CREATE TABLE IF NOT EXISTS shot_sequence_counts (
+        norm_discipline VARCHAR(50) NOT NULL,
+        distance INTEGER NOT NULL,
+        distance_unit VARCHAR(10) NOT NULL,
+        year INTEGER NOT NULL,
+        shot_number INTEGER NOT NULL,
+        shot_value VARCHAR(5) NOT NULL,
+        count BIGINT NOT NULL,
+        PRIMARY KEY (norm_discipline, distance, distance_unit, year, shot_number, shot_value)
+    );
+    """,
+    # Grand aggregate flag and report summaries (see summaries.py)
+    """ALTER TABLE aggregates ADD COLUMN IF NOT EXISTS is_grand BOOLEAN
+       GENERATED ALWAYS AS (match_name LIKE '%Grand%') STORED;""",
+    """CREATE INDEX IF NOT EXISTS aggregates_grand_shooter_idx
+       ON aggregates (shooter_sid, norm_discipline) WHERE is_grand;""",
+    """CREATE INDEX IF NOT EXISTS aggregates_grand_competition_idx
+       ON aggregates (competition_id, norm_discipline) WHERE is_grand;""",
+    """
+    CREATE TABLE IF NOT EXISTS grand_participation (
+        year INTEGER NOT NULL,
+        norm_discipline VARCHAR(50) NOT NULL,
+        shooters INTEGER NOT NULL,
+        entries INTEGER NOT NULL,
+        PRIMARY KEY (year, norm_discipline)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS shooter_grand_stats (
+        sid INTEGER NOT NULL REFERENCES shooters(sid),
+        norm_discipline VARCHAR(50) NOT NULL,
+        wins INTEGER NOT NULL,
+        podiums INTEGER NOT NULL,
+        entries INTEGER NOT NULL,
+        scored_entries INTEGER NOT NULL,
+        score_sum NUMERIC NOT NULL,
+        PRIMARY KEY (sid, norm_discipline)
+    );
+    """,
+    """CREATE INDEX IF NOT EXISTS shooter_grand_stats_podium_idx
+       ON shooter_grand_stats (norm_discipline, wins DESC, podiums DESC);""",
+    # Per-shooter results index (see head_to_head.py)
+    """
+    CREATE TABLE IF NOT EXISTS shooter_results (
+        sid INTEGER NOT NULL,
+        competition_id INTEGER NOT NULL,
+        match_number INTEGER,
+        match_name TEXT,
+        norm_discipline VARCHAR(50),
+        distance VARCHAR(20) NOT NULL DEFAULT '',
+        is_aggregate BOOLEAN NOT NULL,
+        result_id INTEGER NOT NULL,
+        place INTEGER,
+        score NUMERIC,
+        mcsi NUMERIC(7, 2),
+        PRIMARY KEY (is_aggregate, result_id)
+    );
+    """,
+    # Tables created before distance was part of the key
+    "ALTER TABLE shooter_results ADD COLUMN IF NOT EXISTS distance VARCHAR(20) NOT NULL DEFAULT '';",
+    "DROP INDEX IF EXISTS shooter_results_sid_idx;",
+    """CREATE INDEX IF NOT EXISTS shooter_results_sid_key_idx
+       ON shooter_results (sid, competition_id, match_number, match_name, norm_discipline, distance,
+                           is_aggregate)
+       INCLUDE (place, score, mcsi);""",
+    # Kings/Queens classification and event MCSI snapshots (see event_mcsi.py)
+    """
+    CREATE TABLE IF NOT EXISTS kings_queens_rules (
+        state_code VARCHAR(10) NOT NULL DEFAULT '*',
+        match_pattern TEXT NOT NULL,
+        from_year INTEGER,
+        to_year INTEGER,
+        PRIMARY KEY (state_code, match_pattern)
+    );
+    """,
+    *kings_queens_seed_statements(),
+    "ALTER TABLE strings ADD COLUMN IF NOT EXISTS is_kings_queens BOOLEAN NOT NULL DEFAULT FALSE;",
+    """
+    CREATE TABLE IF NOT EXISTS event_mcsi_strings (
+        competition_id INTEGER NOT NULL REFERENCES competitions(competition_id),
+        rank INTEGER NOT NULL,
+        string_id INTEGER NOT NULL,
+        sid INTEGER NOT NULL,
+        discipline VARCHAR(50),
+        distance VARCHAR(20) NOT NULL,
+        score NUMERIC,
+        score_50 NUMERIC,
+        converted BOOLEAN NOT NULL,
+        mcsi NUMERIC(7, 2) NOT NULL,
+        match_name TEXT,
+        PRIMARY KEY (competition_id, rank)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS event_mcsi_shooters (
+        competition_id INTEGER NOT NULL REFERENCES competitions(competition_id),
+        rank INTEGER NOT NULL,
+        sid INTEGER NOT NULL,
+        total_mcsi NUMERIC(9, 2) NOT NULL,
+        avg_mcsi NUMERIC(7, 2) NOT NULL,
+        shoots INTEGER NOT NULL,
+        disciplines TEXT[] NOT NULL,
+        PRIMARY KEY (competition_id, rank)
+    );
+    """,
+    # Resumable import progress, one row per CSV file (see import_results.py)
+    """
+    CREATE TABLE IF NOT EXISTS import_checkpoints (
+        file_hash CHAR(64) PRIMARY KEY,
+        source VARCHAR(500),
+        byte_offset BIGINT NOT NULL,
+        chunk_number INTEGER NOT NULL,
+        competition_ids INTEGER[] NOT NULL DEFAULT '{}',
+        shooter_sids INTEGER[] NOT NULL DEFAULT '{}',
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+]
+
+
+def ensure_schema(conn):
+    """Create any missing tables, columns and indexes."""
+    cur = conn.cursor()
+    for statement in SCHEMA_STATEMENTS:
+        cur.execute(statement)
+    conn.commit()
+
+
+def record_run(conn, source, competition_ids, shooter_sids):
+    """Record a change to the data, bumping the data version. Returns the run id."""
+    cur = conn.cursor()
+    cur.execute(
+        """INSERT INTO import_runs (source, competition_ids, shooter_sids)
+           VALUES (%s, %s, %s) RETURNING run_id;""",
+        (source, sorted(competition_ids), sorted(shooter_sids))
+    )
+    run_id = cur.fetchone()[0]
+    conn.commit()
+    return run_id
+
+
+def get_changes_since(cur, run_id):
+    """Return (last_run_id, competition_ids, shooter_sids) touched after run_id."""
+    cur.execute("SELECT COALESCE(MAX(run_id), %s) FROM import_runs;", (run_id,))
+    last_run_id = cur.fetchone()[0]
+
+    cur.execute("""
+        SELECT DISTINCT unnest(competition_ids) FROM import_runs WHERE run_id > %s;
+    """, (run_id,))
+    competition_ids = {row[0] for row in cur.fetchall()}
+
+    cur.execute("""
+        SELECT DISTINCT unnest(shooter_sids) FROM import_runs WHERE run_id > %s;
+    """, (run_id,))
+    shooter_sids = {row[0] for row in cur.fetchall()}
+
+    return last_run_id, competition_ids, shooter_sids
+
+
+if __name__ == "__main__":
+    conn = get_connection()
+    ensure_schema(conn)
+    conn.close()
+    print("Schema is up to date.")
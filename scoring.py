@@ -0,0 +1,114 @@
+from mcsi_params import get_table
+
+# Discipline normalization mapping
+DISCIPLINE_MAP = {
+    # Target Rifle
+    'Target Rifle - A': 'TR-A',
+    'Target Rifle - B': 'TR-B',
+    'Target Rifle - C': 'TR-C',
+    'Target Rifle - C - Tyro': 'TR-C',
+
+    # F Standard
+    'F Standard - A': 'F-Std-A',
+    'F Standard-A': 'F-Std-A',
+    'F Standard - B': 'F-Std-B',
+    'F Standard-B': 'F-Std-B',
+    'Division F Standard Open': 'F-Std-Open',
+
+    # F Open
+    'F Open': 'F-Open',
+    'F Open - FO': 'F-Open',
+    'Division Open': 'F-Open',
+
+    # F/TR
+    'F/TR - FTR': 'FTR',
+
+    # Sporter - Hunter became Sporter Open
+    'Sporter - Hunter A': 'Sporter-Open',
+    'Sporter - Production Class OPEN - Open': 'Sporter-Open',
+    'Sporter - F Class Open - A': 'Sporter-Open',
+
+    # Sporter PC
+    'Sporter - Production Class - Sporter PC': 'Sporter-PC',
+    'Sporter - F Class - A': 'Sporter-PC',
+}
+
+DISCIPLINE_GROUPS = {
+    'Target Rifle': ['TR-A', 'TR-B', 'TR-C'],
+    'F Standard': ['F-Std-A', 'F-Std-B', 'F-Std-Open'],
+    'F Open': ['F-Open'],
+    'F/TR': ['FTR'],
+    'Sporter': ['Sporter-Open', 'Sporter-PC'],
+}
+
+
+def convert_60_to_50(score, shots_raw):
+    """Convert a score shot on 60-point target to 50-point equivalent.
+    X → V (centre), 6 → 5 (max score)
+    """
+    if score is None:
+        return None, None
+
+    if shots_raw:
+        # Count 6s to subtract from score
+        sixes = shots_raw.count('6')
+        # Convert shots: X→V, 6→5
+        converted_shots = shots_raw.replace('X', 'V').replace('6', '5')
+    else:
+        sixes = 0
+        converted_shots = shots_raw
+
+    # Subtract 1 point for each 6 (since 6→5)
+    points = int(score)
+    centres = round((score % 1) * 10)
+    converted_points = points - sixes
+    converted_score = converted_points + (centres / 10)
+
+    return round(converted_score, 2), converted_shots
+
+
+def needs_60_to_50_conversion(state_code, year, discipline, table=None):
+    """Check if this competition/discipline needs 60→50 conversion."""
+    table = table or get_table()
+    return table.is_60_point(year, state_code, normalize_discipline(discipline))
+
+
+def calculate_mcsi(score, discipline, state_code=None, year=None, shots_raw=None, table=None):
+    """Calculate MCSI from score and discipline.
+
+    Parameters come from the mcsi_params table for the given year and state
+    (see mcsi_params.py), or from table if one is given.
+    """
+    if score is None:
+        return None
+
+    normalized = normalize_discipline(discipline)
+    table = table or get_table()
+    params = table.lookup(year, state_code, normalized)
+
+    if not params:
+        return None
+
+    # Apply 60→50 conversion if needed
+    if state_code and year and needs_60_to_50_conversion(state_code, year, discipline, table):
+        score, _ = convert_60_to_50(score, shots_raw)
+        if score is None:
+            return None
+
+    points = int(score)
+    centres = round((score % 1) * 10)
+    mcsi = ((points + centres) * params['multiplier']) + params['offset']
+    return round(mcsi, 2)
+
+
+def normalize_discipline(disc):
+    """Normalize discipline name."""
+    return DISCIPLINE_MAP.get(disc, disc)
+
+
+def original_disciplines(normalized):
+    """All raw discipline names that normalize to the given name."""
+    originals = [k for k, v in DISCIPLINE_MAP.items() if v == normalized]
+    if normalized not in originals:
+        originals.append(normalized)
+    return originals
@@ -0,0 +1,111 @@
+"""Shot-sequence cube: shot value counts by position within a string.
+
+shot_sequence_counts holds one row per (normalized discipline, distance,
+year, shot_number, shot_value) with the number of shots in that cell. The
+importer adds each chunk's strings as it commits them, so reports read a
+few hundred rows instead of scanning the shots table.
+
+Usage:
+    python shot_sequence.py    # rebuild the cube from the shots table
+"""
+from db import get_connection
+
+# Points for each shot value; X and V are the centre rings
+SHOT_POINTS = {'X': 6, 'V': 5, '6': 6, '5': 5, '4': 4, '3': 3, '2': 2, '1': 1, '0': 0}
+CENTRES = ('X', 'V')
+
+_INSERT_CELLS = '''
+    INSERT INTO shot_sequence_counts
+        (norm_discipline, distance, distance_unit, year, shot_number, shot_value, count)
+    SELECT COALESCE(st.norm_discipline, st.discipline), COALESCE(st.distance, 0),
+           COALESCE(st.distance_unit, ''), c.year, sh.shot_number, sh.shot_value, COUNT(*)
+    FROM shots sh
+    JOIN strings st ON sh.string_id = st.string_id
+    JOIN competitions c ON st.competition_id = c.competition_id
+    {where}
+    GROUP BY 1, 2, 3, 4, 5, 6
+    ON CONFLICT (norm_discipline, distance, distance_unit, year, shot_number, shot_value)
+    DO UPDATE SET count = shot_sequence_counts.count + EXCLUDED.count;
+'''
+
+
+def add_strings(cur, string_ids):
+    """Add the shots of newly inserted strings to the cube."""
+    if string_ids:
+        cur.execute(_INSERT_CELLS.format(where='WHERE st.string_id = ANY(%s)'), (list(string_ids),))
+
+
+def rebuild(conn):
+    """Recompute the whole cube in one transaction."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM shot_sequence_counts;")
+    cur.execute(_INSERT_CELLS.format(where=''))
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(count), 0) FROM shot_sequence_counts;")
+    cells, shots = cur.fetchone()
+    conn.commit()
+    return cells, shots
+
+
+def sequence_report(cur, discipline, year=None, distance=None, distance_unit=None):
+    """Per shot_number value counts, average points and centre rate for one discipline."""
+    filters = ['norm_discipline = %s']
+    params = [discipline]
+    if year is not None:
+        filters.append('year = %s')
+        params.append(year)
+    if distance is not None:
+        filters.append('distance = %s')
+        params.append(distance)
+    if distance_unit is not None:
+        filters.append('distance_unit = %s')
+        params.append(distance_unit)
+
+    cur.execute(f'''
+        SELECT shot_number, shot_value, SUM(count)
+        FROM shot_sequence_counts
+        WHERE {' AND '.join(filters)}
+        GROUP BY shot_number, shot_value
+        ORDER BY shot_number, shot_value;
+    ''', params)
+
+    shots = {}
+    for shot_number, shot_value, count in cur.fetchall():
+        entry = shots.setdefault(shot_number, {'shot_number': shot_number, 'counts': {},
+                                               'total': 0, 'points': 0, 'centres': 0})
+        entry['counts'][shot_value] = int(count)
+        entry['total'] += int(count)
+        entry['points'] += SHOT_POINTS.get(shot_value, 0) * int(count)
+        if shot_value in CENTRES:
+            entry['centres'] += int(count)
+
+    sequence = []
+    for shot_number in sorted(shots):
+        entry = shots[shot_number]
+        total = entry.pop('total')
+        points = entry.pop('points')
+        centres = entry.pop('centres')
+        entry['shots'] = total
+        entry['average'] = round(points / total, 3) if total else None
+        entry['centre_rate'] = round(100 * centres / total, 1) if total else None
+        sequence.append(entry)
+
+    # Distances available for this discipline, for the report filter
+    cur.execute('''
+        SELECT DISTINCT distance, distance_unit
+        FROM shot_sequence_counts
+        WHERE norm_discipline = %s AND distance > 0
+        ORDER BY distance_unit, distance;
+    ''', (discipline,))
+    distances = [{'distance': d, 'unit': u} for d, u in cur.fetchall()]
+
+    return {'discipline': discipline, 'sequence': sequence, 'distances': distances}
+
+
+if __name__ == "__main__":
+    from schema import ensure_schema
+
+    conn = get_connection()
+    ensure_schema(conn)
+    cells, shots = rebuild(conn)
+    conn.close()
+    print(f"Rebuilt shot-sequence cube: {cells} cells covering {shots} shots.")
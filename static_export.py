@@ -0,0 +1,168 @@
+"""Render the read-only pages to static files.
+
+Usage:
+    python static_export.py OUT_DIR                # render every page
+    python static_export.py OUT_DIR --incremental  # only pages touched by imports since the last export
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote
+
+from db import get_connection
+from schema import get_changes_since
+
+MANIFEST_NAME = 'manifest.json'
+
+# Read-only JSON endpoints that take no parameters
+JSON_ENDPOINTS = ['/api/report/discipline-stats']
+
+_client = None
+_out_dir = None
+
+
+def output_path(url):
+    """Map a page URL to its file path relative to the export directory."""
+    parts = [p for p in url.strip('/').split('/') if p]
+    if any(p in ('.', '..') for p in parts):
+        raise ValueError(f"Refusing to export unsafe path: {url}")
+    if url in JSON_ENDPOINTS:
+        return os.path.join(*parts) + '.json'
+    return os.path.join(*parts, 'index.html')
+
+
+def list_pages(cur, competition_ids=None, shooter_sids=None):
+    """List page URLs, optionally limited to the given competitions and shooters.
+
+    With no filters every page is returned. With filters, the index and
+    JSON reports are always included since they summarise all competitions.
+    """
+    full = competition_ids is None and shooter_sids is None
+    competition_ids = sorted(competition_ids or [])
+    shooter_sids = sorted(shooter_sids or [])
+
+    pages = ['/'] + JSON_ENDPOINTS
+
+    comp_filter = '' if full else 'WHERE c.competition_id = ANY(%s)'
+    cur.execute(f'''
+        SELECT c.competition_id, s.code, c.year
+        FROM competitions c
+        JOIN states s ON c.state_id = s.state_id
+        {comp_filter}
+        ORDER BY c.year, s.code;
+    ''', [] if full else [competition_ids])
+    for comp_id, code, year in cur.fetchall():
+        pages.append(f'/competition/{code}/{year}')
+        pages.append(f'/event/{comp_id}/mcsi')
+
+    agg_filter = '' if full else 'WHERE competition_id = ANY(%s)'
+    cur.execute(f'''
+        SELECT DISTINCT competition_id, match_name
+        FROM aggregates
+        {agg_filter}
+        ORDER BY competition_id, match_name;
+    ''', [] if full else [competition_ids])
+    for comp_id, match_name in cur.fetchall():
+        pages.append(f'/aggregate/{comp_id}/{match_name}')
+
+    shooter_filter = '' if full else 'WHERE sid = ANY(%s)'
+    cur.execute(f'SELECT sid FROM shooters {shooter_filter} ORDER BY sid;',
+                [] if full else [shooter_sids])
+    for (sid,) in cur.fetchall():
+        pages.append(f'/shooter/{sid}')
+
+    return pages
+
+
+def _init_worker(out_dir):
+    """Give each worker process its own app and test client."""
+    global _client, _out_dir
+    from app import app
+    _client = app.test_client()
+    _out_dir = out_dir
+
+
+def _render(url):
+    """Render one page and write it to disk. Returns (url, status)."""
+    response = _client.get(quote(url))
+    if response.status_code == 200:
+        path = os.path.join(_out_dir, output_path(url))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(response.get_data())
+        os.replace(tmp_path, path)
+    return url, response.status_code
+
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(out_dir, run_id, rendered, failed):
+    """Record the run exported up to and the pages that still need rendering."""
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'run_id': run_id, 'pages_rendered': rendered, 'failed': failed}, f, indent=2)
+
+
+def export(out_dir, incremental=False, processes=None):
+    """Render pages to out_dir, in parallel across processes."""
+    os.makedirs(out_dir, exist_ok=True)
+
+    conn = get_connection()
+    cur = conn.cursor()
+
+    manifest = read_manifest(out_dir) if incremental else None
+    if manifest is None:
+        if incremental:
+            print("No previous export found, rendering everything.")
+        last_run_id, _, _ = get_changes_since(cur, 0)
+        pages = list_pages(cur)
+    else:
+        last_run_id, competition_ids, shooter_sids = get_changes_since(cur, manifest['run_id'])
+        retry = manifest.get('failed', [])
+        if last_run_id == manifest['run_id'] and not retry:
+            conn.close()
+            print("Export is up to date.")
+            return 0
+        print(f"Imports since run {manifest['run_id']} touched "
+              f"{len(competition_ids)} competitions and {len(shooter_sids)} shooters; "
+              f"retrying {len(retry)} pages that failed last time.")
+        pages = []
+        if last_run_id != manifest['run_id']:
+            pages = list_pages(cur, competition_ids, shooter_sids)
+        listed = set(pages)
+        pages += [url for url in retry if url not in listed]
+
+    conn.close()
+
+    print(f"Rendering {len(pages)} pages...")
+    failed = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(out_dir,)) as pool:
+        for url, status in pool.map(_render, pages, chunksize=32):
+            if status != 200:
+                failed.append((url, status))
+
+    for url, status in failed:
+        print(f"  {status} {url}")
+    print(f"Rendered {len(pages) - len(failed)} pages, {len(failed)} failed.")
+
+    # Failed pages are kept in the manifest so the next incremental run retries them
+    write_manifest(out_dir, last_run_id, len(pages) - len(failed), [url for url, _ in failed])
+    return len(pages) - len(failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export pages to static HTML/JSON.")
+    parser.add_argument('out_dir')
+    parser.add_argument('--incremental', action='store_true',
+                        help="only re-render pages touched by imports since the last export")
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    export(args.out_dir, incremental=args.incremental, processes=args.processes)
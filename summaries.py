@@ -0,0 +1,87 @@
+"""Summary tables behind the participation and podium reports.
+
+grand_participation counts distinct shooters per (year, normalized
+discipline) in Grand aggregates; shooter_grand_stats holds each shooter's
+wins, podiums, entries and score total per normalized discipline. The
+importer refreshes the keys each chunk touches inside the chunk's
+transaction, so readers always see totals that match the aggregates.
+
+Usage:
+    python summaries.py    # rebuild both tables from aggregates
+"""
+from db import get_connection
+
+
+def refresh_participation(cur, competition_ids):
+    """Recount participation for every year the given competitions belong to."""
+    cur.execute("SELECT DISTINCT year FROM competitions WHERE competition_id = ANY(%s);",
+                (list(competition_ids),))
+    years = [row[0] for row in cur.fetchall()]
+    if not years:
+        return
+
+    cur.execute("DELETE FROM grand_participation WHERE year = ANY(%s);", (years,))
+    cur.execute('''
+        INSERT INTO grand_participation (year, norm_discipline, shooters, entries)
+        SELECT c.year, a.norm_discipline, COUNT(DISTINCT a.shooter_sid), COUNT(*)
+        FROM aggregates a
+        JOIN competitions c ON a.competition_id = c.competition_id
+        WHERE a.is_grand AND a.norm_discipline IS NOT NULL
+          AND c.year = ANY(%s)
+        GROUP BY c.year, a.norm_discipline;
+    ''', (years,))
+
+
+def refresh_shooter_stats(cur, shooter_sids):
+    """Recompute Grand aggregate totals for the given shooters."""
+    shooter_sids = list(shooter_sids)
+    if not shooter_sids:
+        return
+
+    cur.execute("DELETE FROM shooter_grand_stats WHERE sid = ANY(%s);", (shooter_sids,))
+    cur.execute('''
+        INSERT INTO shooter_grand_stats
+            (sid, norm_discipline, wins, podiums, entries, scored_entries, score_sum)
+        SELECT shooter_sid, norm_discipline,
+               COUNT(*) FILTER (WHERE place = 1),
+               COUNT(*) FILTER (WHERE place <= 3),
+               COUNT(*),
+               COUNT(score),
+               COALESCE(SUM(score), 0)
+        FROM aggregates
+        WHERE is_grand AND norm_discipline IS NOT NULL
+          AND shooter_sid = ANY(%s)
+        GROUP BY shooter_sid, norm_discipline;
+    ''', (shooter_sids,))
+
+
+def refresh(cur, competition_ids, shooter_sids):
+    refresh_participation(cur, competition_ids)
+    refresh_shooter_stats(cur, shooter_sids)
+
+
+def rebuild(conn):
+    from field_ranks import fill_norm_discipline
+
+    cur = conn.cursor()
+    cur.execute("SELECT competition_id FROM competitions;")
+    competition_ids = [row[0] for row in cur.fetchall()]
+    fill_norm_discipline(cur, competition_ids)
+    cur.execute("SELECT DISTINCT shooter_sid FROM aggregates WHERE is_grand;")
+    shooter_sids = [row[0] for row in cur.fetchall()]
+
+    cur.execute("DELETE FROM grand_participation;")
+    cur.execute("DELETE FROM shooter_grand_stats;")
+    refresh(cur, competition_ids, shooter_sids)
+    conn.commit()
+    return len(competition_ids), len(shooter_sids)
+
+
+if __name__ == "__main__":
+    from schema import ensure_schema
+
+    conn = get_connection()
+    ensure_schema(conn)
+    competitions, shooters = rebuild(conn)
+    conn.close()
+    print(f"Rebuilt summaries for {competitions} competitions and {shooters} shooters.")
@@ -0,0 +1,74 @@
+import os
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
+
+import pytest
+
+from scoring import convert_60_to_50
+
+# (score, shots_raw) as stored, covering sixes, X centres, no shots and NULLs
+CASES = [
+    (58.6, '6X6V66X6X65'),
+    (60.10, '666666666666'),
+    (49.0, '555545555555'),
+    (45.2, 'X5465V5X4556'),
+    (0.0, '000000'),
+    (57.0, None),
+    (57.3, ''),
+    (None, '666'),
+    (None, None),
+]
+
+
+def _round(value, places=0):
+    """Postgres numeric round(): half away from zero."""
+    return value.quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+
+
+def sql_convert_score(score, shots):
+    """Decimal transcription of the SQL function convert_score_60_to_50."""
+    if score is None:
+        return None
+    score = Decimal(str(score))
+    shots = shots or ''
+    whole = score.quantize(Decimal(1), rounding=ROUND_DOWN)
+    sixes = len(shots) - len(shots.replace('6', ''))
+    return _round(whole - sixes + _round((score - whole) * 10) / 10, 2)
+
+
+def sql_convert_shots(shots):
+    """Transcription of the SQL function convert_shots_60_to_50."""
+    return None if shots is None else shots.replace('X', 'V').replace('6', '5')
+
+
+@pytest.mark.parametrize('score, shots', CASES)
+def test_python_matches_sql_functions(score, shots):
+    expected_score = sql_convert_score(score, shots)
+    converted_score, converted_shots = convert_60_to_50(score, shots)
+    if expected_score is None:
+        assert converted_score is None
+    else:
+        assert Decimal(str(converted_score)) == expected_score
+        assert converted_shots == sql_convert_shots(shots)
+
+
+@pytest.mark.skipif(not os.getenv('TEST_DATABASE_URL'),
+                    reason="set TEST_DATABASE_URL to check the installed SQL functions")
+@pytest.mark.parametrize('score, shots', CASES)
+def test_sql_functions_in_database(score, shots):
+    import psycopg2
+
+    from conversions import FUNCTION_STATEMENTS
+
+    conn = psycopg2.connect(os.environ['TEST_DATABASE_URL'])
+    try:
+        cur = conn.cursor()
+        for statement in FUNCTION_STATEMENTS:
+            cur.execute(statement)
+        cur.execute("SELECT convert_score_60_to_50(%s::numeric, %s), convert_shots_60_to_50(%s);",
+                    (score, shots, shots))
+        db_score, db_shots = cur.fetchone()
+        assert db_score == sql_convert_score(score, shots)
+        assert db_shots == sql_convert_shots(shots)
+    finally:
+        conn.rollback()
+        conn.close()
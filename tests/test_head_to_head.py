@@ -0,0 +1,65 @@
+from head_to_head import compare, load_results, shared_results
+
+
+class FakeCursor:
+    """Returns rows in the order Postgres would with ORDER BY under en_US collation."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params):
+        self.sids = params[0]
+
+    def fetchall(self):
+        return [row for row in self.rows if row[0] in self.sids]
+
+
+def row(sid, match_number, match_name, place, score, comp_id=1, disc='TR-A', distance='',
+        is_aggregate=True, mcsi=None):
+    return (sid, comp_id, match_number, match_name, disc, distance, is_aggregate, place, score, mcsi)
+
+
+def test_null_match_numbers_and_mixed_case_names_merge():
+    rows = [
+        # NULL match numbers sort last in Postgres, but are keyed as 0
+        row(1, 2, 'Match', 1, 50),
+        row(1, None, 'grand agg', 2, 290),
+        row(2, 2, 'Match', 2, 48),
+        row(2, None, 'grand agg', 1, 295),
+        # 'grand agg' sorts before 'Match' under en_US, after it in Python
+        row(1, 5, 'grand agg', 1, 99, comp_id=2),
+        row(1, 5, 'Match', 1, 49, comp_id=2),
+        row(2, 5, 'grand agg', 2, 97, comp_id=2),
+        row(2, 5, 'Match', 2, 47, comp_id=2),
+    ]
+    results = load_results(FakeCursor(rows), [1, 2])
+    shared = list(shared_results(results))
+    assert [(key[0], key[1], key[2]) for key, _ in shared] == [
+        (1, 0, 'grand agg'), (1, 2, 'Match'), (2, 5, 'Match'), (2, 5, 'grand agg'),
+    ]
+
+    matches, pairs = compare(results)
+    assert len(matches) == 4
+    record = pairs[0]['disciplines']['TR-A']
+    assert (record['shared_aggregates'], record['wins'], record['losses']) == (4, 3, 1)
+
+
+def test_unshared_results_are_skipped():
+    rows = [row(1, 1, 'Match', 1, 50), row(2, 2, 'Match', 1, 50), row(3, None, None, 1, 50, disc=None)]
+    results = load_results(FakeCursor(rows), [1, 2, 3])
+    assert list(shared_results(results)) == []
+
+
+def test_strings_at_different_distances_stay_separate():
+    rows = [
+        row(1, 3, 'Match 3', None, 48, distance='300y', is_aggregate=False, mcsi=90),
+        row(1, 3, 'Match 3', None, 45, distance='600y', is_aggregate=False, mcsi=80),
+        row(2, 3, 'Match 3', None, 46, distance='300y', is_aggregate=False, mcsi=85),
+        row(2, 3, 'Match 3', None, 49, distance='600y', is_aggregate=False, mcsi=95),
+    ]
+    matches, pairs = compare(load_results(FakeCursor(rows), [1, 2]))
+    assert [(m['distance'], m['results'][1]['mcsi'], m['results'][2]['mcsi']) for m in matches] == [
+        ('300y', 90, 85), ('600y', 80, 95),
+    ]
+    record = pairs[0]['disciplines']['TR-A']
+    assert (record['shared_strings'], record['avg_mcsi_delta']) == (2, -5.0)
@@ -0,0 +1,22 @@
+import pytest
+
+from import_results import CSV_COLUMNS, parse_records, read_records
+
+ROW = 'VRA 2025,1,Match 1,300,y,TR-A,1,Ann Lee,Lee,Ann,Club,VIC,5V555,,50.5'
+
+
+def parse(tmp_path, body):
+    path = tmp_path / 'results.csv'
+    path.write_text(','.join(CSV_COLUMNS) + '\n' + body)
+    return [row for row, _ in parse_records(read_records(str(path)))]
+
+
+def test_blank_lines_are_skipped(tmp_path):
+    rows = parse(tmp_path, f'{ROW}\n\n{ROW}\n\n')
+    assert [(r.competition, r.match_number, r.distance, r.score) for r in rows] == \
+        [('VRA 2025', 1, 300, 50.5)] * 2
+
+
+def test_short_record_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='Short CSV record'):
+        parse(tmp_path, f'{ROW}\nVRA 2025,1\n')
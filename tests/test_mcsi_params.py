@@ -0,0 +1,36 @@
+from mcsi_params import ParamTable
+
+BASE = (2025, '*', 'TR-A', 1.62, 8.4)
+
+
+def test_state_row_does_not_reach_back_before_its_year():
+    table = ParamTable([BASE, (2026, 'VRA', 'TR-A', 2.0, 0)], [])
+    assert table.lookup(2025, 'VRA', 'TR-A') == {'multiplier': 1.62, 'offset': 8.4}
+    assert table.lookup(2026, 'VRA', 'TR-A') == {'multiplier': 2.0, 'offset': 0.0}
+    assert table.lookup(2027, 'VRA', 'TR-A') == {'multiplier': 2.0, 'offset': 0.0}
+
+
+def test_nearest_earlier_year_wins():
+    table = ParamTable([BASE, (2027, '*', 'TR-A', 1.7, 5)], [])
+    assert table.lookup(2026, 'NSWRA', 'TR-A') == {'multiplier': 1.62, 'offset': 8.4}
+    assert table.lookup(2030, 'NSWRA', 'TR-A') == {'multiplier': 1.7, 'offset': 5.0}
+
+
+def test_earliest_year_only_when_nothing_is_earlier():
+    table = ParamTable([BASE, (2026, 'VRA', 'TR-A', 2.0, 0)], [])
+    assert table.lookup(2020, 'VRA', 'TR-A') == {'multiplier': 1.62, 'offset': 8.4}
+
+    state_only = ParamTable([(2026, 'VRA', 'F-Open', 1.5, 2)], [])
+    assert state_only.lookup(2020, 'VRA', 'F-Open') == {'multiplier': 1.5, 'offset': 2.0}
+    assert state_only.lookup(2026, 'QRA', 'F-Open') is None
+
+
+def test_unknown_discipline():
+    assert ParamTable([BASE], []).lookup(2025, 'VRA', 'F-Open') is None
+
+
+def test_60_point_slices():
+    table = ParamTable([BASE], [(2025, 'VRA', 'Sporter-Open'), (2026, '*', 'TR-A')])
+    assert table.is_60_point(2025, 'VRA', 'Sporter-Open')
+    assert not table.is_60_point(2025, 'QRA', 'Sporter-Open')
+    assert table.is_60_point(2026, 'QRA', 'TR-A')